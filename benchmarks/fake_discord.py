@@ -0,0 +1,304 @@
+"""
+A local stand-in for the parts of discord.py 0.16 that PlasmaBot uses.
+
+install() puts it in sys.modules as 'discord' before plasmaBot is imported, so the bot can be driven by the replay harness without a
+Discord connection.  API calls succeed after a configurable delay and everything sent is counted on the client.
+"""
+
+import sys
+import time
+import types
+import asyncio
+import itertools
+
+ids = itertools.count(300000000000000000)
+
+def next_id():
+    return str(next(ids))
+
+class HTTPException(Exception):
+    pass
+
+class Forbidden(HTTPException):
+    pass
+
+class NotFound(HTTPException):
+    pass
+
+class LoginFailure(Exception):
+    pass
+
+class Game:
+    def __init__(self, name=None, url=None, type=0):
+        self.name = name
+        self.url = url
+        self.type = type
+
+class Permissions:
+    def __init__(self, administrator=False, manage_messages=True, manage_roles=True):
+        self.administrator = administrator
+        self.manage_messages = manage_messages
+        self.manage_roles = manage_roles
+
+class PermissionOverwrite:
+    def __init__(self, **kwargs):
+        self.send_messages = None
+        self.speak = None
+
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+class Object:
+    def __init__(self, id):
+        self.id = id
+
+class User:
+    def __init__(self, name, discriminator='1234', bot=False, id=None):
+        self.id = id or next_id()
+        self.name = name
+        self.discriminator = discriminator
+        self.bot = bot
+        self.avatar_url = ''
+
+    @property
+    def mention(self):
+        return '<@{}>'.format(self.id)
+
+class Member(User):
+    def __init__(self, server, name, discriminator='1234', bot=False, id=None, roles=None):
+        super().__init__(name, discriminator, bot, id)
+        self.server = server
+        self.nick = None
+        self.roles = roles or []
+        self.voice_channel = None
+
+    @property
+    def display_name(self):
+        return self.nick or self.name
+
+class Role:
+    def __init__(self, server, name, position=0, id=None):
+        self.id = id or next_id()
+        self.server = server
+        self.name = name
+        self.position = position
+
+    @property
+    def mention(self):
+        return '<@&{}>'.format(self.id)
+
+class Channel:
+    def __init__(self, server, name, id=None, is_private=False):
+        self.id = id or next_id()
+        self.server = server
+        self.name = name
+        self.is_private = is_private
+        self.overwrites = {}
+
+    @property
+    def mention(self):
+        return '<#{}>'.format(self.id)
+
+    def permissions_for(self, member):
+        return Permissions(administrator=getattr(member, 'administrator', False))
+
+    def overwrites_for(self, target):
+        return self.overwrites.get(target.id, PermissionOverwrite())
+
+class Server:
+    def __init__(self, name, id=None):
+        self.id = id or next_id()
+        self.name = name
+        self.members = {}
+        self.channels = []
+        self.roles = []
+        self.owner = None
+        self.me = None
+
+    @property
+    def owner_id(self):
+        return self.owner.id if self.owner else None
+
+    @property
+    def default_channel(self):
+        return self.channels[0] if self.channels else None
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    def get_channel(self, channel_id):
+        for channel in self.channels:
+            if channel.id == channel_id:
+                return channel
+
+class Message:
+    def __init__(self, channel, author, content, mentions=(), id=None):
+        self.id = id or next_id()
+        self.channel = channel
+        self.server = channel.server
+        self.author = author
+        self.content = content
+        self.clean_content = content
+        self.timestamp = time.time()
+        self.tts = False
+
+        self.mentions = list(mentions)
+        self.raw_mentions = [user.id for user in mentions]
+        self.channel_mentions = []
+        self.raw_channel_mentions = []
+        self.role_mentions = []
+        self.raw_role_mentions = []
+
+class AppInfo:
+    def __init__(self, id):
+        self.id = id
+
+class Client:
+    def __init__(self, loop=None, **options):
+        self.loop = loop or asyncio.get_event_loop()
+        self.user = None
+        self.servers = []
+
+        # Seconds every simulated API call takes
+        self.api_latency = 0.0
+
+        self.api_calls = {}
+        self.pending_events = set()
+        self.event_timings = []
+
+    def count_call(self, name):
+        self.api_calls[name] = self.api_calls.get(name, 0) + 1
+
+    async def api(self, name):
+        self.count_call(name)
+
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+        else:
+            await asyncio.sleep(0)
+
+    def dispatch(self, event, *args, **kwargs):
+        method = 'on_' + event
+
+        if hasattr(self, method):
+            task = self.loop.create_task(self._run_event(method, *args, **kwargs))
+            self.pending_events.add(task)
+            task.add_done_callback(self.pending_events.discard)
+
+    async def _run_event(self, method, *args, **kwargs):
+        # Same signature as discord.py's, which the bot wraps
+        start = time.perf_counter()
+
+        try:
+            await getattr(self, method)(*args, **kwargs)
+        except Exception:
+            import traceback
+            traceback.print_exc()
+        finally:
+            self.event_timings.append((method[3:], time.perf_counter() - start))
+
+    def get_channel(self, channel_id):
+        for server in self.servers:
+            channel = server.get_channel(channel_id)
+            if channel:
+                return channel
+
+    def get_all_members(self):
+        for server in self.servers:
+            for member in server.members.values():
+                yield member
+
+    async def send_message(self, destination, content=None, *, tts=False, embed=None):
+        await self.api('send_message')
+
+        if isinstance(destination, (User, Member)):
+            destination = Channel(None, 'direct', is_private=True)
+
+        return Message(destination, self.user, content or '')
+
+    async def send_typing(self, destination):
+        await self.api('send_typing')
+
+    async def edit_message(self, message, new_content=None, *, embed=None):
+        await self.api('edit_message')
+        message.content = message.clean_content = new_content
+        return message
+
+    async def delete_message(self, message):
+        await self.api('delete_message')
+
+    async def delete_messages(self, messages):
+        await self.api('delete_messages')
+
+    async def purge_from(self, channel, *, limit=100, check=None, before=None, after=None, around=None):
+        await self.api('purge_from')
+        return []
+
+    async def change_status(self, game=None, idle=False):
+        await self.api('change_status')
+
+    async def application_info(self):
+        await self.api('application_info')
+        return AppInfo(self.user.id)
+
+    async def add_roles(self, member, *roles):
+        await self.api('add_roles')
+        member.roles = member.roles + [role for role in roles if not role in member.roles]
+
+    async def remove_roles(self, member, *roles):
+        await self.api('remove_roles')
+        member.roles = [role for role in member.roles if not role in roles]
+
+    async def edit_channel_permissions(self, channel, target, overwrite=None, **kwargs):
+        await self.api('edit_channel_permissions')
+        channel.overwrites[target.id] = overwrite
+
+    async def create_role(self, server, **fields):
+        await self.api('create_role')
+        role = Role(server, fields.get('name', 'new role'))
+        server.roles.append(role)
+        return role
+
+    async def move_role(self, server, role, position):
+        await self.api('move_role')
+        role.position = position
+
+    async def kick(self, member):
+        await self.api('kick')
+
+    async def ban(self, member, delete_message_days=1):
+        await self.api('ban')
+
+    async def unban(self, server, user):
+        await self.api('unban')
+
+    async def get_bans(self, server):
+        await self.api('get_bans')
+        return []
+
+    async def logout(self):
+        pass
+
+    async def start(self, *args, **kwargs):
+        raise LoginFailure('The benchmark client can not connect to Discord')
+
+def install():
+    module = types.ModuleType('discord')
+
+    for name, value in list(globals().items()):
+        if isinstance(value, type):
+            setattr(module, name, value)
+
+    module.errors = types.ModuleType('discord.errors')
+    module.errors.LoginFailure = LoginFailure
+    module.errors.HTTPException = HTTPException
+    module.errors.Forbidden = Forbidden
+    module.errors.NotFound = NotFound
+
+    module.utils = types.ModuleType('discord.utils')
+    module.utils.oauth_url = lambda client_id, permissions=None, server=None, redirect_uri=None: 'https://discordapp.com/oauth2/authorize?client_id={}&scope=bot'.format(client_id)
+
+    sys.modules['discord'] = module
+    sys.modules['discord.errors'] = module.errors
+    sys.modules['discord.utils'] = module.utils
+    return module
@@ -0,0 +1,452 @@
+"""
+Offline replay benchmarks for PlasmaBot.
+
+    python benchmarks/replay.py [scenario ...] [--events N] [--rate EVENTS_PER_SECOND] [--api-latency SECONDS]
+                                [--rate-limits] [--tracemalloc] [--replay FILE] [--json FILE] [--verbose]
+
+Every scenario builds a fresh PlasmaBot in a temporary directory against the stand-in client in fake_discord.py, replays a stream of
+gateway events through Client.dispatch and reports throughput, latency percentiles and memory.  Recorded streams can be replayed
+with --replay, one JSON event per line:
+
+    {"event": "message", "channel": 0, "author": 3, "content": ">help", "mentions": [4, 5], "at": 0.25, "setup": false}
+
+event is one of message, message_edit, typing, member_update or role_update.  author and mentions index the benchmark server's
+members (0 is the bot owner), channel indexes its channels and role (for role_update and member_update) indexes its roles.
+Events marked setup run before measuring starts.
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import traceback
+import contextlib
+
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIRECTORY)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_discord
+
+discord = fake_discord.install()
+
+import plasmaBot.outbound
+
+from plasmaBot.bot import PlasmaBot
+from plasmaBot.latency import PBHistogram, PBLatencyTracker
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+OWNER_ID = '100000000000000001'
+BOT_ID = '100000000000000002'
+
+class PBBenchShutdown:
+    def bot_shutdown(self):
+        pass
+
+    def bot_restart(self):
+        pass
+
+class PBBenchWorld:
+    def __init__(self, members=250, channels=20, roles=10):
+        self.server = discord.Server('Benchmark Server')
+
+        self.bot_user = discord.Member(self.server, 'PlasmaBot', '0001', bot=True, id=BOT_ID)
+        self.owner = discord.Member(self.server, 'Owner', '0002', id=OWNER_ID)
+
+        self.server.me = self.bot_user
+        self.server.owner = self.owner
+
+        self.members = [self.owner]
+        for index in range(1, members):
+            self.members.append(discord.Member(self.server, 'Member {}'.format(index), '{:04d}'.format(index % 9999 + 1)))
+
+        for member in [self.bot_user] + self.members:
+            self.server.members[member.id] = member
+
+        self.channels = [discord.Channel(self.server, 'channel-{}'.format(index)) for index in range(channels)]
+        self.server.channels = self.channels
+
+        self.roles = [discord.Role(self.server, 'Role {}'.format(index), index) for index in range(roles)]
+        self.server.roles = self.roles
+
+    def build(self, event):
+        # Turns one replay event into the arguments Client.dispatch would receive from the gateway
+        channel = self.channels[event.get('channel', 0) % len(self.channels)]
+        author = self.members[event.get('author', 0) % len(self.members)]
+
+        if event['event'] in ['message', 'message_edit']:
+            mentions = [self.members[index % len(self.members)] for index in event.get('mentions', [])]
+            content = event.get('content', '')
+
+            if mentions and not '<@' in content:
+                content += ' ' + ' '.join(member.mention for member in mentions)
+
+            message = discord.Message(channel, author, content, mentions)
+
+            if event['event'] == 'message':
+                return 'message', (message,)
+
+            edited = discord.Message(channel, author, content + ' (edited)', mentions, id=message.id)
+            return 'message_edit', (message, edited)
+
+        elif event['event'] == 'typing':
+            return 'typing', (channel, author, time.time())
+
+        elif event['event'] == 'member_update':
+            after = discord.Member(self.server, author.name, author.discriminator, id=author.id, roles=[self.roles[event.get('role', 0) % len(self.roles)]])
+            return 'member_update', (author, after)
+
+        elif event['event'] == 'role_update':
+            role = self.roles[event.get('role', 0) % len(self.roles)]
+            return 'server_role_update', (role, role)
+
+        raise ValueError('Unknown replay event {}'.format(event['event']))
+
+def chat(count, members=250):
+    return [{'event': 'message', 'channel': random.randrange(20), 'author': random.randrange(1, members), 'content': 'just chatting about things #{}'.format(index)}
+            for index in range(count)]
+
+def scenario_help_spam(count):
+    events = [{'event': 'message', 'channel': random.randrange(20), 'author': random.randrange(1, 250), 'content': '>help'} for index in range(count)]
+    return [], events
+
+def scenario_custom_commands(count):
+    setup = [{'event': 'message', 'author': 0, 'content': '>custom add bench{} Custom response {{args[0]}} number {}'.format(index, index)} for index in range(200)]
+
+    events = []
+    for index in range(count):
+        if random.random() < 0.7:
+            events.append({'event': 'message', 'channel': random.randrange(20), 'author': random.randrange(1, 250), 'content': '>bench{} hello'.format(random.randrange(200))})
+        else:
+            events += chat(1)
+
+    return setup, events
+
+def scenario_afk_storm(count):
+    afk_members = list(range(1, 51))
+
+    setup = [{'event': 'message', 'author': member, 'content': '>afk benchmarking'} for member in afk_members]
+    events = [{'event': 'message', 'channel': random.randrange(20), 'author': random.randrange(51, 250), 'content': 'hey',
+               'mentions': random.sample(afk_members, random.randint(1, 5))} for index in range(count)]
+
+    return setup, events
+
+def scenario_mute(count):
+    events = [{'event': 'message', 'channel': 0, 'author': 0, 'content': '>mute', 'mentions': list(range(1 + (index * 50) % 200, 51 + (index * 50) % 200))}
+              for index in range(count)]
+    return [], events
+
+def scenario_gateway_mix(count):
+    events = []
+
+    for index in range(count):
+        roll = random.random()
+
+        if roll < 0.4:
+            events += chat(1)
+        elif roll < 0.6:
+            events.append({'event': 'message_edit', 'channel': random.randrange(20), 'author': random.randrange(1, 250), 'content': 'an edited message'})
+        elif roll < 0.8:
+            events.append({'event': 'typing', 'channel': random.randrange(20), 'author': random.randrange(1, 250)})
+        elif roll < 0.95:
+            events.append({'event': 'member_update', 'author': random.randrange(1, 250), 'role': random.randrange(10)})
+        else:
+            events.append({'event': 'role_update', 'role': random.randrange(10)})
+
+    return [], events
+
+# name -> (scenario, default number of events)
+PB_SCENARIOS = {
+    'help_spam': (scenario_help_spam, 2000),
+    'custom_commands': (scenario_custom_commands, 2000),
+    'afk_storm': (scenario_afk_storm, 2000),
+    'mute_50_users': (scenario_mute, 10),
+    'gateway_mix': (scenario_gateway_mix, 5000)
+}
+
+def load_replay(replay_file):
+    setup = []
+    events = []
+
+    with open(replay_file, encoding='utf-8') as replay:
+        for line in replay:
+            if line.strip():
+                event = json.loads(line)
+                (setup if event.get('setup') else events).append(event)
+
+    return setup, events
+
+def write_options(options):
+    with open(os.path.join(REPO_DIRECTORY, 'plasmaBot', 'defaults', 'example_options.ini'), encoding='utf-8') as example:
+        config_text = example.read()
+
+    replacements = {
+        'Token = ': 'Token = benchmark',
+        'OwnerID = ': 'OwnerID = ' + OWNER_ID,
+        'DebugMode = ': 'DebugMode = no',
+        'TerminalLog = ': 'TerminalLog = no',
+        'MetricsFile = ': 'MetricsFile = no'
+    }
+
+    lines = []
+    for line in config_text.splitlines():
+        for prefix, replacement in replacements.items():
+            if line.startswith(prefix):
+                line = replacement
+        lines.append(line)
+
+    with open(os.path.join('config', 'options.ini'), 'w', encoding='utf-8') as options_file:
+        options_file.write('\n'.join(lines) + '\n')
+
+def percentiles(values):
+    if not values:
+        return (0.0, 0.0, 0.0, 0.0)
+
+    values = sorted(values)
+    pick = lambda percent: values[min(int(len(values) * percent / 100), len(values) - 1)]
+    return (pick(50), pick(95), pick(99), values[-1])
+
+def merged(tracker, kind):
+    histogram = PBHistogram()
+    cpu = PBHistogram()
+
+    for entry in tracker.current[kind].values():
+        histogram = histogram.merge(entry.wall)
+        cpu = cpu.merge(entry.cpu)
+
+    return histogram, cpu
+
+def rss_megabytes():
+    if resource is None:
+        return 0.0
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+async def replay(bot, world, events, rate):
+    start = bot.loop.time()
+
+    for index, event in enumerate(events):
+        if rate:
+            delay = start + index / rate - bot.loop.time()
+        elif 'at' in event:
+            delay = start + event['at'] - bot.loop.time()
+        else:
+            delay = 0
+
+        # Always yield, so the bot works through the stream while it is being replayed
+        await asyncio.sleep(max(delay, 0))
+
+        event_name, args = world.build(event)
+        bot.dispatch(event_name, *args)
+
+async def drain(bot, timeout=600):
+    deadline = time.monotonic() + timeout
+
+    while bot.pending_events or bot.tasks.running or bot.tasks.queue or bot.send_queue.queues:
+        if time.monotonic() > deadline:
+            raise TimeoutError('Bot did not finish processing the replayed events')
+
+        await asyncio.sleep(0.005)
+
+async def drive(bot, world, setup, events, options):
+    bot.user = world.bot_user
+    bot.servers = [world.server]
+    bot.api_latency = options.api_latency
+
+    await bot.on_ready()
+    await bot.plugin_manager.warm_up()
+
+    await replay(bot, world, setup, 0)
+    await drain(bot)
+
+    # Only the measured stream is reported
+    bot.event_timings = []
+    bot.api_calls = {}
+    bot.latency = PBLatencyTracker()
+    bot.query_stats.reset()
+    sent_before = bot.send_queue.sent
+    dropped_before = bot.tasks.dropped
+    rss_before = rss_megabytes()
+
+    if options.tracemalloc:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+
+    await replay(bot, world, events, options.rate)
+    await drain(bot)
+
+    elapsed = time.perf_counter() - start
+
+    result = {
+        'events': len(events),
+        'seconds': elapsed,
+        'events_per_second': len(events) / elapsed if elapsed else 0.0,
+        'messages_sent': bot.send_queue.sent - sent_before,
+        'api_calls': dict(bot.api_calls),
+        'dropped_tasks': bot.tasks.dropped - dropped_before,
+        'handlers': percentiles([seconds for event, seconds in bot.event_timings]),
+        'rss_mb': rss_megabytes(),
+        'rss_growth_mb': rss_megabytes() - rss_before,
+        'queries': dict((row['caller'], row['count']) for row in bot.query_stats.summary())
+    }
+
+    for kind in ['command', 'hook']:
+        wall, cpu = merged(bot.latency, kind)
+        result[kind + 's'] = {
+            'count': wall.count,
+            'wall': (wall.percentile(50), wall.percentile(95), wall.percentile(99), wall.max),
+            'cpu': (cpu.percentile(50), cpu.percentile(95), cpu.percentile(99), cpu.max)
+        }
+
+    if options.tracemalloc:
+        result['tracemalloc_peak_mb'] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+
+    return result
+
+async def stop(bot):
+    bot.expiry.flush()
+    bot.tasks.cancel_queued()
+
+    pending = [task for task in asyncio.all_tasks(bot.loop) if task is not asyncio.current_task(bot.loop)]
+    for task in pending:
+        task.cancel()
+
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    # Stops the writer threads once everything queued (the expiry flush included) is committed
+    bot.storage.close()
+
+def run_scenario(name, setup, events, options):
+    original_directory = os.getcwd()
+    work_directory = tempfile.mkdtemp(prefix='plasmabot_bench_')
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    # The bot and its plugins print freely, which would swamp the report and slow the run
+    output = io.StringIO()
+    quiet = contextlib.redirect_stdout(output) if not options.verbose else contextlib.suppress()
+
+    try:
+        os.chdir(work_directory)
+        os.makedirs('config')
+        os.makedirs('data')
+        write_options(options)
+
+        with quiet:
+            bot = PlasmaBot(PBBenchShutdown())
+            world = PBBenchWorld()
+
+            try:
+                return loop.run_until_complete(drive(bot, world, setup, events, options))
+            finally:
+                loop.run_until_complete(stop(bot))
+    except Exception:
+        if not options.verbose:
+            print(output.getvalue()[-5000:])
+        raise
+    finally:
+        loop.close()
+        os.chdir(original_directory)
+
+        if options.keep:
+            print('[BENCH] {} files kept in {}'.format(name, work_directory))
+        else:
+            shutil.rmtree(work_directory, ignore_errors=True)
+
+def report(name, result):
+    milliseconds = lambda values: ' / '.join('{:.2f}'.format(value * 1000) for value in values)
+
+    print('[BENCH] {}: {} events in {:.2f} s ({:.0f} events/s), {} messages sent, {} tasks dropped'.format(
+        name, result['events'], result['seconds'], result['events_per_second'], result['messages_sent'], result['dropped_tasks']))
+    print('    gateway handlers    p50 / p95 / p99 / max ms: {}'.format(milliseconds(result['handlers'])))
+
+    for kind in ['commands', 'hooks']:
+        if result[kind]['count']:
+            print('    {:<9} wall       p50 / p95 / p99 / max ms: {}  ({} runs)'.format(kind, milliseconds(result[kind]['wall']), result[kind]['count']))
+            print('    {:<9} on-loop cpu p50 / p95 / p99 / max ms: {}'.format(kind, milliseconds(result[kind]['cpu'])))
+
+    memory = '    memory              peak RSS {:.1f} MB (+{:.1f} MB during the run)'.format(result['rss_mb'], result['rss_growth_mb'])
+    if 'tracemalloc_peak_mb' in result:
+        memory += ', tracemalloc peak {:.1f} MB'.format(result['tracemalloc_peak_mb'])
+    print(memory)
+
+    if result['queries']:
+        busiest = sorted(result['queries'].items(), key=lambda item: item[1], reverse=True)[:3]
+        print('    database calls      {} ({:.2f} per event), most from {}'.format(
+            sum(result['queries'].values()), sum(result['queries'].values()) / result['events'], ', '.join('{} {}'.format(caller, count) for caller, count in busiest)))
+
+    if result['api_calls']:
+        print('    api calls           ' + ', '.join('{} {}'.format(call, count) for call, count in sorted(result['api_calls'].items())))
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay synthetic or recorded gateway traffic through PlasmaBot without connecting to Discord.')
+    parser.add_argument('scenarios', nargs='*', help='Scenarios to run: {} (default: all)'.format(', '.join(PB_SCENARIOS)))
+    parser.add_argument('--events', type=int, default=None, help='Number of events per scenario (default: per scenario)')
+    parser.add_argument('--rate', type=float, default=0, help='Events per second to replay at (default: as fast as the bot keeps up)')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='Seconds each simulated Discord API call takes')
+    parser.add_argument('--rate-limits', action='store_true', help="Keep the send queue's per-channel rate limits (off by default, as they only measure waiting)")
+    parser.add_argument('--tracemalloc', action='store_true', help='Track Python allocations during the run (slow)')
+    parser.add_argument('--replay', action='append', default=[], help='Replay a recorded JSON lines event file as its own scenario')
+    parser.add_argument('--seed', type=int, default=2860, help='Random seed for the synthetic scenarios')
+    parser.add_argument('--json', help='Write the results to this file as JSON')
+    parser.add_argument('--keep', action='store_true', help="Keep each scenario's temporary directory")
+    parser.add_argument('--verbose', action='store_true', help="Show the bot's own output")
+    options = parser.parse_args()
+
+    if not options.rate_limits:
+        plasmaBot.outbound.PB_SEND_BUCKET_SIZE = 1000000000
+
+    unknown = [name for name in options.scenarios if not name in PB_SCENARIOS]
+    if unknown:
+        parser.error('Unknown scenario(s): {}'.format(', '.join(unknown)))
+
+    runs = []
+
+    for name in options.scenarios or ([] if options.replay else list(PB_SCENARIOS)):
+        random.seed(options.seed)
+        scenario, default_count = PB_SCENARIOS[name]
+        runs.append((name,) + scenario(options.events or default_count))
+
+    for replay_file in options.replay:
+        runs.append((os.path.basename(replay_file),) + load_replay(replay_file))
+
+    results = {}
+
+    for name, setup, events in runs:
+        try:
+            results[name] = run_scenario(name, setup, events, options)
+        except Exception:
+            print('[BENCH] {} failed:'.format(name))
+            traceback.print_exc()
+            continue
+
+        report(name, results[name])
+
+    if options.json:
+        with open(options.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2, sort_keys=True)
+
+    return 0 if len(results) == len(runs) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
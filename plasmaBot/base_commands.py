@@ -1,5 +1,9 @@
 from plasmaBot.plugin import PBPlugin, PBPluginMeta, Response
+from plasmaBot.profiler import PB_PROFILE_MAX_SECONDS
 import discord
+import asyncio
+import sqlite3
+import traceback
 
 import copy
 
@@ -16,82 +20,25 @@ class BaseCommands(PBPlugin):
     def __init__(self, plasmaBot):
         super().__init__(plasmaBot)
 
-    async def cmd_help(self, help_command=None):
+    async def cmd_help(self, message, help_command=None):
         """
         Usage:
             {command_prefix}help [command]
 
         Get a List of Bot Commands, or get help about a given Command.
         """
+        plugin_names = self.bot.plugin_manager.get_enabled_names(message.server)
+
         if help_command:
             help_command = help_command.lower().strip()
-            raw_commands_return = self.bot.plugin_db.table('commands').select("PLUGIN_NAME", "COMMAND_USAGE", "COMMAND_DESCRIPTION").where("COMMAND_KEY").equals(help_command).execute()
-
-            cmd_plugin = ''
-            cmd_usage = ''
-            cmd_description = ''
 
-            for command_data in raw_commands_return:
-                cmd_plugin = command_data[0]
-                cmd_usage = command_data[1]
-                cmd_description = command_data[2]
-
-            if cmd_plugin == '':
+            if not self.bot.plugin_manager.help.is_visible(help_command, plugin_names):
                 return
 
-            raw_plugin_return = self.bot.plugin_db.table('plugins').select("FANCY_NAME").where("PLUGIN_NAME").equals(cmd_plugin).execute()
-            for item in raw_plugin_return:
-                cmd_plugin = item[0]
-
-            help_response = '```Usage for ' + self.bot.config.prefix + help_command
-            help_response += ' (' + cmd_plugin + '):'
-            help_response += '\n     '
-            help_response += cmd_usage + '\n\n'
-            help_response += cmd_description + '```'
+            help_response = self.bot.plugin_manager.help.usage(help_command)
 
         else:
-            plugins_commands_dict = {}
-            raw_commands_return = self.bot.plugin_db.table('commands').select("COMMAND_KEY", "PLUGIN_NAME", "COMMAND_DESCRIPTION", "HELP_EXCLUDE").execute()
-
-            for command in raw_commands_return:
-                command_key = command[0]
-                plugin = command[1]
-                description = command[2]
-                exclude = command[3]
-
-                if not exclude == "YES":
-                    cmd_entry = command_key + ": " + description
-                    if not plugin in plugins_commands_dict:
-                        plugins_commands_dict[plugin] = [cmd_entry]
-                    else:
-                        plugins_commands_dict[plugin] = plugins_commands_dict[plugin] + [cmd_entry]
-
-            help_response = "**{}'s Commands:**```\n".format(self.bot.config.bot_name)
-            secondary_response = ''
-
-            for plugin, commands in plugins_commands_dict.items():
-                raw_plugin_return = self.bot.plugin_db.table('plugins').select("FANCY_NAME").where("PLUGIN_NAME").equals(plugin).execute()
-
-                for item in raw_plugin_return:
-                    fancy_name = item[0]
-
-                if plugin == 'BaseCommands':
-                    help_response += fancy_name + '\n'
-
-                    for command in commands:
-                        help_response += ' • ' + self.bot.config.prefix + command + '\n'
-
-                    help_response += '\n'
-                else:
-                    secondary_response += fancy_name + '\n'
-
-                    for command in commands:
-                        secondary_response += ' • ' + self.bot.config.prefix + command + '\n'
-
-                    secondary_response += '\n'
-
-            help_response += secondary_response
-            help_response += '```'
+            help_response = self.bot.plugin_manager.help.listing(plugin_names)
 
         return Response(help_response, reply=False, delete_after=60)
 
@@ -112,7 +59,7 @@ class BaseCommands(PBPlugin):
                 helper_role_id = raw_role_mentions[2]
                 black_role_id = raw_role_mentions[3]
 
-                self.bot.permissions.set_server_permissions(server, admin_role_id, mod_role_id, helper_role_id, black_role_id)
+                await self.bot.permissions.set_server_permissions(server, admin_role_id, mod_role_id, helper_role_id, black_role_id)
 
                 return Response("Server Permissions Ranks have been updated succesfully! :+1:\n\n_Administrator Role_: <@&{}>\n_Moderator Role_: <@&{}>\n_Helper Role_: <@&{}>\n_Blacklisted Role_: <@&{}>".format(admin_role_id, mod_role_id, helper_role_id, black_role_id))
             else:
@@ -122,7 +69,7 @@ class BaseCommands(PBPlugin):
         else:
             return Response("You must have the Manage Server Permission in order to set Server Permissions", reply=True, delete_after=45)
 
-    async def cmd_perms(self, author, channel, server, user_mentions):
+    async def cmd_perms(self, message, author, channel, server, user_mentions):
         """
         Usage:
             {command_prefix}perms (@Mentioned_User) [@AnotherMentionedUser] [@YetAnotherUser] ...
@@ -132,6 +79,8 @@ class BaseCommands(PBPlugin):
         help_exclude
         """
         if user_mentions:
+            replies = []
+
             for user in user_mentions:
                 perms = await self.bot.permissions.check_permissions(user, channel, server)
 
@@ -160,11 +109,14 @@ class BaseCommands(PBPlugin):
 
                 perms_message = author.mention + ', ' + perms_message
 
-                await self.bot.safe_send_message(
+                replies.append(self.bot.safe_send_message(
                     channel, perms_message,
                     expire_in=30 if self.bot.config.delete_messages else 0,
                     also_delete=message if self.bot.config.delete_invoking else None
-                )
+                ))
+
+            # Queue every reply at once so the send queue can merge them into as few messages as possible
+            await asyncio.gather(*replies)
         else:
             return Response(send_help=True)
 
@@ -186,6 +138,242 @@ class BaseCommands(PBPlugin):
         else:
             return Response(permissions_error=True)
 
+    async def cmd_plugin(self, server, auth_perms, modifier=None, plugin_name=None):
+        """
+        Usage:
+            {command_prefix}plugin [enable | disable] [plugin_name]
+
+        List the plugins enabled on this server, or enable and disable them.  Requires the Administrator Role.
+
+        help_exclude
+        """
+        if not modifier:
+            plugins_response = '**{}\'s Plugins:**\n```'.format(server.name)
+
+            for plugin_key, plugin_info in self.bot.plugin_manager.registry.plugins.items():
+                if self.bot.plugin_manager.is_enabled(plugin_key, server.id):
+                    plugin_state = 'Enabled'
+                else:
+                    plugin_state = 'Disabled'
+                plugins_response += ' • {} ({}): {}\n'.format(plugin_key, plugin_info.fancy_name, plugin_state)
+
+            plugins_response += '```'
+
+            return Response(plugins_response, reply=False, delete_after=60)
+
+        if auth_perms < 45:
+            return Response(permissions_error=True)
+
+        modifier = modifier.lower()
+
+        if not plugin_name or not modifier in ['enable', 'disable']:
+            return Response(send_help=True)
+
+        plugin_key = None
+
+        for registered_name in self.bot.plugin_manager.registry.plugins:
+            if registered_name.lower() == plugin_name.lower():
+                plugin_key = registered_name
+
+        if not plugin_key:
+            return Response('No Plugin `{}` Available'.format(plugin_name), reply=True, delete_after=15)
+
+        try:
+            changed = await self.bot.plugin_manager.set_plugin_enabled(server, plugin_key, modifier == 'enable')
+        except sqlite3.Error:
+            traceback.print_exc()
+            return Response('Plugin `{}` could not be {}d.  Please try again later.'.format(plugin_key, modifier), reply=True, delete_after=15)
+
+        if changed:
+            return Response('Plugin `{}` has been {}d on this server'.format(plugin_key, modifier), reply=True, delete_after=30)
+        else:
+            return Response('Plugin `{}` can not be {}d'.format(plugin_key, modifier), reply=True, delete_after=15)
+
+    async def cmd_reload(self, auth_perms, plugin_name):
+        """
+        Usage:
+            {command_prefix}reload (plugin_name)
+
+        Reload a plugin's module without restarting the bot.  Bot Owner only.
+
+        help_exclude
+        """
+        if auth_perms < 100:
+            return Response(permissions_error=True)
+
+        plugin_key = None
+
+        for registered_name in self.bot.plugin_manager.registry.plugins:
+            if registered_name.lower() == plugin_name.lower():
+                plugin_key = registered_name
+
+        if not plugin_key:
+            return Response('No Plugin `{}` Available'.format(plugin_name), reply=True, delete_after=15)
+
+        try:
+            reloaded = await self.bot.plugin_manager.reload_plugin(plugin_key)
+        except exceptions.CommandError as e:
+            return Response(e.message, reply=True, delete_after=30)
+
+        return Response('Reloaded `{}`'.format('`, `'.join(reloaded)), reply=True, delete_after=30)
+
+    async def cmd_stats(self, auth_perms):
+        """
+        Usage:
+            {command_prefix}stats
+
+        Show event loop lag, task and event rate statistics.  Bot Owner only.
+
+        help_exclude
+        """
+        if auth_perms < 100:
+            return Response(permissions_error=True)
+
+        stats = self.bot.monitor.stats()
+        tasks = stats['tasks']
+        send_queue = stats['send_queue']
+
+        stats_response = '**{} Health:**```\n'.format(self.bot.config.bot_name)
+        stats_response += 'Uptime: {:.0f} s\n'.format(stats['uptime'])
+        stats_response += 'Loop Lag: {:.1f} ms (average {:.1f} ms, worst this window {:.1f} ms, worst ever {:.1f} ms)\n'.format(
+            stats['loop_lag'] * 1000, stats['loop_lag_average'] * 1000, stats['loop_lag_window_max'] * 1000, stats['loop_lag_max'] * 1000)
+        stats_response += 'Pending asyncio Tasks: {}\n'.format(stats['pending_tasks'])
+        stats_response += 'Plugin Tasks: {} running, {} queued, {} delayed, {} dropped, {} failed\n'.format(
+            tasks['running'], tasks['queued'], tasks['delayed'], tasks['dropped'], tasks['failures'])
+        stats_response += 'Send Queue: {} sent, {} merged, {} waiting\n'.format(send_queue['sent'], send_queue['coalesced'], send_queue['queued'])
+        stats_response += 'Expiring Messages: {}\n'.format(stats['expiring_messages'])
+
+        if stats['event_rates']:
+            stats_response += '\nEvents per Second:\n'
+            for event, rate in sorted(stats['event_rates'].items(), key=lambda item: item[1], reverse=True)[:10]:
+                stats_response += ' • {}: {:.2f}\n'.format(event, rate)
+
+        stats_response += '```'
+
+        return Response(stats_response, reply=False, delete_after=60)
+
+    async def cmd_latency(self, auth_perms, latency_type='commands'):
+        """
+        Usage:
+            {command_prefix}latency [commands | hooks | events]
+
+        Show the slowest commands, plugin event hooks or gateway events over the last 15 to 30 minutes.  Bot Owner only.
+
+        help_exclude
+        """
+        if auth_perms < 100:
+            return Response(permissions_error=True)
+
+        latency_type = latency_type.lower()
+
+        if not latency_type in ['commands', 'hooks', 'events']:
+            return Response(send_help=True)
+
+        rows = self.bot.latency.stats()[latency_type][:15]
+
+        if not rows:
+            return Response('No {} have been timed yet'.format(latency_type), reply=True, delete_after=15)
+
+        latency_response = '**{} Latency (ms, wall / cpu):**```\n'.format(latency_type.capitalize())
+
+        for row in rows:
+            latency_response += '{}: {} runs, p50 {:.1f}/{:.1f}, p95 {:.1f}/{:.1f}, p99 {:.1f}/{:.1f}, max {:.1f}\n'.format(
+                row['key'], row['count'], row['wall_p50'] * 1000, row['cpu_p50'] * 1000, row['wall_p95'] * 1000, row['cpu_p95'] * 1000,
+                row['wall_p99'] * 1000, row['cpu_p99'] * 1000, row['wall_max'] * 1000)
+
+        latency_response += '```'
+
+        return Response(latency_response, reply=False, delete_after=60)
+
+    async def cmd_queries(self, auth_perms, query_type='commands'):
+        """
+        Usage:
+            {command_prefix}queries [commands | hooks | events | background | reset]
+
+        Show how many database calls each command, plugin event hook or gateway event makes, and where the time goes.  Bot Owner only.
+
+        help_exclude
+        """
+        if auth_perms < 100:
+            return Response(permissions_error=True)
+
+        query_type = query_type.lower()
+
+        if query_type == 'reset':
+            self.bot.query_stats.reset()
+            return Response('Query statistics have been reset', reply=True, delete_after=15)
+
+        if not query_type in ['commands', 'hooks', 'events', 'background']:
+            return Response(send_help=True)
+
+        kind = query_type.rstrip('s')
+        rows = self.bot.query_stats.summary(kind)[:10]
+
+        if not rows:
+            return Response('No {} have made database calls yet'.format(query_type), reply=True, delete_after=15)
+
+        # Runs come from the latency tracker, which only remembers the last 15 to 30 minutes
+        runs = {}
+        if kind != 'background':
+            for row in self.bot.latency.stats()[query_type]:
+                runs[kind + ':' + row['key']] = row
+
+        queries_response = '**Database Calls by {} (ms):**```\n'.format(query_type.capitalize())
+
+        for row in rows:
+            queries_response += '{}: {} calls, {:.1f} total, max {:.1f}'.format(row['caller'].split(':', 1)[-1], row['count'], row['total'] * 1000, row['max'] * 1000)
+
+            latency_row = runs.get(row['caller'])
+            if latency_row and latency_row['count']:
+                queries_response += ', {:.1f} per run (max {})'.format(latency_row['queries'] / latency_row['count'], latency_row['queries_max'])
+
+            queries_response += '\n'
+
+            for query in row['queries'][:3]:
+                queries_response += '    {} x{}, {:.1f} total, max {:.1f}\n'.format(query['name'], query['count'], query['total'] * 1000, query['max'] * 1000)
+
+        queries_response += '```'
+
+        return Response(queries_response, reply=False, delete_after=60)
+
+    async def cmd_profile(self, channel, auth_perms, seconds='30'):
+        """
+        Usage:
+            {command_prefix}profile [seconds]
+
+        Sample the bot's stack for a number of seconds and report where it spends its time.  Bot Owner only.
+
+        help_exclude
+        """
+        if auth_perms < 100:
+            return Response(permissions_error=True)
+
+        if self.bot.profiler.running:
+            return Response('The profiler is already running', reply=True, delete_after=15)
+
+        try:
+            seconds = min(max(float(seconds), 1), PB_PROFILE_MAX_SECONDS)
+        except ValueError:
+            return Response(send_help=True)
+
+        await self.bot.safe_send_message(channel, 'Profiling for {:.0f} seconds...'.format(seconds), expire_in=seconds if self.bot.config.delete_messages else 0)
+
+        report_file = await self.bot.profiler.profile(seconds)
+
+        profile_response = '**Profile ({} samples, saved to `{}`):**```\n'.format(self.bot.profiler.samples, report_file)
+
+        for frame, self_count, total_count in self.bot.profiler.top_frames():
+            profile_response += '{:5.1f}% self, {:5.1f}% total: {}\n'.format(
+                self_count * 100 / max(self.bot.profiler.samples, 1), total_count * 100 / max(self.bot.profiler.samples, 1), frame)
+
+        profile_response += '```'
+
+        if self.bot.config.log_channel and self.bot.config.log_channel != channel:
+            await self.bot.safe_send_message(self.bot.config.log_channel, profile_response)
+            return Response('Profile complete, summary sent to the log channel', reply=True, delete_after=30)
+
+        return Response(profile_response, reply=False, delete_after=120)
+
     async def cmd_ping(self):
         """
         Usage:
@@ -8,23 +8,28 @@ import asyncio
 
 import discord
 
-from SQLiteHelper import SQLiteHelper as sq
-
 from . import exceptions
 
 from plasmaBot.config import Config, ConfigDefaults
 from plasmaBot.permissions import Permissions
 from plasmaBot.plugin import PBPluginManager, Response, PBPluginMeta, PBPlugin
-
-from plasmaBot.defaults.database_tables import dbt_plugins, dbt_commands, dbt_server, dbt_toggles
+from plasmaBot.tasks import PBTaskSupervisor, PB_LOW_PRIORITY_EVENTS
+from plasmaBot.expiry import PBExpiryScheduler
+from plasmaBot.outbound import PBSendQueue
+from plasmaBot.monitor import PBMonitor
+from plasmaBot.latency import PBLatencyTracker
+from plasmaBot.profiler import PBSamplingProfiler
+from plasmaBot.context import PBMessageContext
+from plasmaBot.storage import PBStorage
+from plasmaBot.querystats import PBQueryStats
+
+from plasmaBot.defaults.database_tables import dbt_server, dbt_expiring_messages
 
 from plasmaBot.base_commands import BaseCommands
 
-from plasmaBot.plugins.TBA import TBAPlugin
-from plasmaBot.plugins.moderation import Moderation
-from plasmaBot.plugins.utilities import Utilities
-from plasmaBot.plugins.meme_generator import MemeGenerator
-from plasmaBot.plugins.custom_commands import CustomCommands
+# Plugins are registered from their source and only imported on their first command or event, or in the background after on_ready
+PB_PLUGIN_MODULES = ['plasmaBot.plugins.TBA', 'plasmaBot.plugins.moderation', 'plasmaBot.plugins.utilities', 'plasmaBot.plugins.meme_generator',
+                     'plasmaBot.plugins.custom_commands']
 
 # Logging setup
 logger = logging.getLogger('discord')
@@ -41,6 +46,13 @@ class PlasmaBot(discord.Client):
 
         self.config = Config()
 
+        # Timing for commands, plugin hooks and gateway events, and for the database calls each of them makes
+        self.latency = PBLatencyTracker()
+        self.query_stats = PBQueryStats(self)
+
+        # Every database the bot and its plugins use, each with its own writer thread
+        self.storage = PBStorage(self)
+
         self.permissions = Permissions(self.config.permissions_db, self)
 
         print("[PB][CONFIG] Currently Running PlasmaBot v{0}".format(self.version))
@@ -49,30 +61,24 @@ class PlasmaBot(discord.Client):
 
         self.message_list = {}
 
-        self.plugin_db = sq.Connect(self.config.plugin_db)
-        self.plugin_db_connection = self.plugin_db.getConn()
-        self.plugin_db_cursor = self.plugin_db_connection.cursor()
+        self.tasks = PBTaskSupervisor(self, self.config.max_tasks, self.config.max_plugin_tasks, self.config.max_queued_tasks)
+        self.send_queue = PBSendQueue(self)
+        self.monitor = PBMonitor(self)
+        self.profiler = PBSamplingProfiler(self)
 
-        # Kill old instances of Plugin and Command Tables, to repopulate based on currently enabled plugins
-        self.plugin_db_cursor.execute('DROP TABLE IF EXISTS plugins')
-        self.plugin_db_cursor.execute('DROP TABLE IF EXISTS commands')
-        self.plugin_db_cursor.execute('DROP TABLE IF EXISTS toggles')
+        self.plugin_db = self.storage.get(self.config.plugin_db)
 
-        # Set Up Plugin and Command Databases
-        table_raw_plugins = dbt_plugins()
-        self.plugin_db.table('plugins').init(table_raw_plugins)
-        table_raw_cmd = dbt_commands()
-        self.plugin_db.table('commands').init(table_raw_cmd)
-        table_raw_toggles = dbt_toggles()
-        self.plugin_db.table('toggles').init(table_raw_toggles)
+        # Plugin, Command and Toggle metadata lives in the plugin manager's registry (mirrored to the plugin database if PluginDBMirror is set)
+        self.plugin_db.ensure_table('servers', dbt_server())
+        self.plugin_db.ensure_table('expiring_messages', dbt_expiring_messages())
 
-        if not self.plugin_db.table('servers').tableExists():
-            table_raw_servers = dbt_server()
-            self.plugin_db.table('servers').init(table_raw_servers)
+        # Messages waiting to be auto-deleted, restored from the last run and deleted by a single background task
+        self.expiry = PBExpiryScheduler(self)
+        self.expiry.load()
 
-        # Load Plugins, and add their commands and information to self.plugin_db
+        # Load Plugins, and add their commands and information to the plugin registry
         self.plugin_manager = PBPluginManager(self)
-        self.plugin_manager.load_all()
+        self.plugin_manager.load_all(PB_PLUGIN_MODULES)
 
     def run(self):
         try:
@@ -94,7 +100,13 @@ class PlasmaBot(discord.Client):
         except: # Can be ignored
             pass
 
-        self.plugin_db_connection.close()
+        saved = self.expiry.flush()
+        if saved:
+            saved.result()
+
+        self.storage.close()
+
+        self.tasks.cancel_queued()
 
         pending = asyncio.Task.all_tasks()
         gathered = asyncio.gather(*pending)
@@ -116,15 +128,24 @@ class PlasmaBot(discord.Client):
         plugins = await self.plugin_manager.get_all(server)
         return plugins
 
-    async def toggle_key(self, server, key):
-        toggle_settings = self.plugin_db.table('toggles').select("PLUGIN_NAME").where("TOGGLE_NAME").equals(key.lower()).execute()
+    def dispatch(self, event, *args, **kwargs):
+        self.monitor.count(event)
+        super().dispatch(event, *args, **kwargs)
+
+    def _run_event(self, event, *args, **kwargs):
+        # discord.py runs each gateway handler (on_message, on_server_join...) through here.  Timing it also charges its database calls to the event.
+        return self.latency.timed(super()._run_event(event, *args, **kwargs), 'event', event)
 
-        plugin_name = ''
+    def dispatch_plugins(self, event, server, *args):
+        low_priority = event in PB_LOW_PRIORITY_EVENTS
 
-        for item in toggle_settings:
-            plugin_name = item[0]
+        for plugin_name, handler in self.plugin_manager.get_subscribers(event, server):
+            self.tasks.spawn(self.latency.timed(handler(*args), 'hook', plugin_name + '.' + event), plugin_name, low_priority)
 
-        if not plugin_name == '':
+    async def toggle_key(self, server, key):
+        plugin_name = self.plugin_manager.registry.get_toggle(key.lower())
+
+        if plugin_name:
             plugin = await self.plugin_manager.get_plugin_by_name(plugin_name)
             response = await plugin.toggle(server, key)
             if response[0] == 'SUCCESS':
@@ -169,9 +190,13 @@ class PlasmaBot(discord.Client):
             self.game = discord.Game(name=self.config.bot_game_compiled)
         await self.change_status(self.game)
 
-        enabled_plugins = await self.get_plugins()
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_ready())
+        self.expiry.start()
+        self.monitor.start()
+        self.storage.start()
+
+        self.dispatch_plugins('on_ready', None)
+
+        self.loop.create_task(self.plugin_manager.warm_up())
 
     async def on_server_join(self, server):
         if self.config.debug:
@@ -180,10 +205,7 @@ class PlasmaBot(discord.Client):
                 server.owner.name
             ))
 
-        s_owner = ''
-        server_permissions_return = self.permissions.perm_db.table('servers').select("OWNER_ID").where("SERVER_ID").equals(server.id).execute()
-        for row in server_permissions_return:
-            s_owner = row[0]
+        s_owner = (await self.permissions.get_server_permissions(server.id))[0]
 
         server_welcome_message = 'Hello {}!\n\n'.format(server.owner.mention)
         server_welcome_message += 'I am {}, a Discord Moderation and Utility Bot!\n'.format(self.config.bot_name)
@@ -220,9 +242,9 @@ class PlasmaBot(discord.Client):
                 print('[PB][LOGGING] Found Connection to Log Channel {}'.format(self.config.raw_log_channel))
                 await self.safe_send_message(self.config.log_channel, "_{} has been initiated.  Starting Traceback Logging..._".format(self.config.bot_name))
 
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_server_join(server))
+        self.plugin_manager.index_server(server.id)
+
+        self.dispatch_plugins('on_server_join', server, server)
 
     async def on_server_remove(self, server):
         if self.config.debug:
@@ -246,24 +268,21 @@ class PlasmaBot(discord.Client):
             if not self.config.log_channel:
                 print('[PB][LOGGING] Connection to Log Channel {} has been destroyed.  Reconnect to Log Channel to resume Logging'.format(self.config.raw_log_channel))
 
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_server_remove(server))
+        self.dispatch_plugins('on_server_remove', server, server)
 
-    async def _wait_delete_msg(self, message, delay):
-        await asyncio.sleep(delay)
-        await self.safe_delete_message(message)
+        self.plugin_manager.drop_server(server.id)
 
     async def safe_send_message(self, dest, content, *, tts=False, expire_in=0, also_delete=None):
+        # Returns None if the send failed.  Content merged with other sends to the channel returns the shared message.
         msg = None
         try:
-            msg = await self.send_message(dest, content, tts=tts)
+            msg = await self.send_queue.send(dest, content, tts=tts, expire_in=expire_in)
 
             if msg and expire_in:
-                asyncio.ensure_future(self._wait_delete_msg(msg, expire_in))
+                self.expiry.schedule(msg, expire_in)
 
             if also_delete and isinstance(also_delete, discord.Message):
-                asyncio.ensure_future(self._wait_delete_msg(also_delete, expire_in))
+                self.expiry.schedule(also_delete, expire_in)
 
         except discord.Forbidden:
             if self.config.debug:
@@ -308,48 +327,51 @@ class PlasmaBot(discord.Client):
                 print("[PB][PERMISSIONS] Could not send typing to %s, no permssion" % destination)
 
     async def on_message(self, message):
+        server = message.server
+        message_is_command = message.content.strip().startswith(self.config.prefix)
+        subscribers = self.plugin_manager.get_subscribers('on_message', server)
+
+        # Ordinary chat that no plugin listens for and nobody logs costs nothing beyond the checks above
+        if not message_is_command and not subscribers and not self.config.terminal_log:
+            return
 
-        auth_perms = await self.permissions.check_permissions(message.author, message.channel, None)
+        if message_is_command or self.plugin_manager.needs_permissions(subscribers):
+            auth_perms = await self.permissions.check_permissions(message.author, message.channel, None)
+        else:
+            # Without a permissions lookup only the configured owners can be told apart from other users
+            auth_perms = 100 if message.author.id == self.config.owner_id or message.author.id == self.config.debug_id else None
 
         message_type = None
 
         if message.author.id == self.user.id:
             message_type = 'self'
-        elif auth_perms >= 100:
+        elif auth_perms is not None and auth_perms >= 100:
             message_type = 'owner'
         elif message.author.bot:
             message_type = 'bot'
         else:
             message_type = 'user'
 
-        message_context = None
-        message_location = " | "
-
-        if message.server:
-            message_context = 'server'
-            message_location += message.server.name + " #" + message.channel.name
-        else:
-            message_context = 'direct'
-            message_location += "Direct Message"
-
-        if message.content.strip().startswith(self.config.prefix):
-            message_is_command = True
-            cmd_message = '[COMMAND]'
-            if auth_perms == 0:
-                cmd_message += '[BLACKLISTED]'
-        else:
-            message_is_command = False
-            cmd_message = ''
+        context = PBMessageContext(self, message, message_type)
 
         if self.config.terminal_log:
-            print('[PB][MESSAGE][' + message_context.upper() + '][' + message_type.upper() + ']' + cmd_message + ' "' + " \\n ".join(message.content.split("\n")).strip() + '" ~' + message.author.name + '(#' + message.author.discriminator + ')' + message_location)
+            if server:
+                message_location = " | " + server.name + " #" + message.channel.name
+            else:
+                message_location = " | Direct Message"
 
-        if message_is_command:
-            glob_cmd, *glob_args = message.content.strip().split()
-            glob_cmd = glob_cmd[len(self.config.prefix):].lower().strip()
+            if message_is_command:
+                cmd_message = '[COMMAND]'
+                if auth_perms == 0:
+                    cmd_message += '[BLACKLISTED]'
+            else:
+                cmd_message = ''
+
+            print('[PB][MESSAGE][' + context.location.upper() + '][' + message_type.upper() + ']' + cmd_message + ' "' + " \\n ".join(context.content.split("\n")) + '" ~' + message.author.name + '(#' + message.author.discriminator + ')' + message_location)
 
-            if auth_perms >= 100 and (glob_cmd == 'restart' or glob_cmd == 'shutdown'):
-                if glob_cmd == 'shutdown':
+        if message_is_command:
+            if auth_perms >= 100 and context.command_is('restart', 'shutdown'):
+                if context.command_key == 'shutdown':
                     await self.safe_send_message(message.channel, ':skull_crossbones: {} is shutting down'.format(self.config.bot_name))
 
                     if self.config.log_channel:
@@ -369,113 +391,90 @@ class PlasmaBot(discord.Client):
                     self.shutdown()
                 message_is_command = False
 
-        server = message.server
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            if message_is_command and auth_perms > 0:
-                self.loop.create_task(plugin.on_command(message, message_type, message_context))
+        if message_is_command and auth_perms > 0:
+            command = self.plugin_manager.get_command(context.command_key)
+            if command and command.plugin_name in self.plugin_manager.get_enabled(server):
+                self.tasks.spawn(self.latency.timed(self.plugin_manager.run_command(command, context), 'command', command.key), command.plugin_name)
 
-            self.loop.create_task(plugin.on_message(message, message_type, message_context))
+        self.dispatch_plugins('on_message', server, message, context)
 
 
     async def on_message_edit(self, before, after):
         if before.channel.is_private:
             return
 
-        server = after.server
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_message_edit(before, after))
+        self.dispatch_plugins('on_message_edit', after.server, before, after)
 
     async def on_message_delete(self, message):
         if message.channel.is_private:
             return
 
-        server = message.server
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_message_delete(message))
+        self.dispatch_plugins('on_message_delete', message.server, message)
 
     async def on_channel_create(self, channel):
         if channel.is_private:
             return
 
-        server = channel.server
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_channel_create(channel))
+        self.dispatch_plugins('on_channel_create', channel.server, channel)
 
     async def on_channel_update(self, before, after):
         if before.is_private:
             return
 
-        server = after.server
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_channel_update(before, after))
+        self.dispatch_plugins('on_channel_update', after.server, before, after)
 
     async def on_channel_delete(self, channel):
         if channel.is_private:
             return
 
-        server = channel.server
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_channel_delete(channel))
+        self.dispatch_plugins('on_channel_delete', channel.server, channel)
 
     async def on_member_join(self, member):
-        server = member.server
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_member_join(member))
+        self.dispatch_plugins('on_member_join', member.server, member)
 
     async def on_member_remove(self, member):
-        server = member.server
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_member_remove(member))
+        self.dispatch_plugins('on_member_remove', member.server, member)
 
     async def on_member_update(self, before, after):
         server = after.server
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_member_update(before, after))
+
+        if before.roles != after.roles:
+            self.permissions.invalidate_server(server.id)
+
+        self.dispatch_plugins('on_member_update', server, before, after)
 
     async def on_server_update(self, before, after):
         server = after
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_server_update(before, after))
 
-    async def on_server_role_create(self, role):
-        server = role.server
+        if before.owner_id != after.owner_id:
+            await self.permissions.update_server_owner(server)
+
+        self.dispatch_plugins('on_server_update', server, before, after)
 
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_server_role_create(role))
+    async def on_server_role_create(self, role):
+        self.dispatch_plugins('on_server_role_create', role.server, role)
 
     async def on_server_role_delete(self, role):
         server = role.server
 
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_server_role_delete(role))
+        self.permissions.invalidate_server(server.id)
+
+        self.dispatch_plugins('on_server_role_delete', server, role)
 
     async def on_server_role_update(self, before, after):
-        server = None
-        for s in self.servers:
-            if after.id in map(lambda r: r.id, s.roles):
-                server = s
-                break
+        server = after.server
 
         if server is None:
             return
 
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_server_role_update(before, after))
+        self.permissions.invalidate_server(server.id)
+
+        self.dispatch_plugins('on_server_role_update', server, before, after)
 
     async def on_voice_state_update(self, before, after):
+        if not self.plugin_manager.has_subscribers('on_voice_state_update'):
+            return
+
         if after is None and before is None:
             return
         elif after is None:
@@ -485,29 +484,22 @@ class PlasmaBot(discord.Client):
         else:
             server = after.server
 
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_voice_state_update(before, after))
+        self.dispatch_plugins('on_voice_state_update', server, before, after)
 
     async def on_member_ban(self, member):
-        server = member.server
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_member_ban(member))
+        self.dispatch_plugins('on_member_ban', member.server, member)
 
     async def on_member_unban(self, server, member):
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_member_unban(server, member))
+        self.dispatch_plugins('on_member_unban', server, server, member)
 
     async def on_typing(self, channel, user, when):
+        if not self.plugin_manager.has_subscribers('on_typing'):
+            return
+
         if channel.is_private:
             return
 
-        server = channel.server
-        enabled_plugins = await self.get_plugins(server)
-        for plugin in enabled_plugins:
-            self.loop.create_task(plugin.on_typing(channel, user, when))
+        self.dispatch_plugins('on_typing', channel.server, channel, user, when)
 
 
 if __name__ == '__main__':
@@ -103,6 +103,26 @@ class Config:
 
         self.pl_config_directory = config.get('Files', 'PLConfigDirectory', fallback=ConfigDefaults.pl_config_directory)
 
+        self.plugin_db_mirror = config.getboolean('Files', 'PluginDBMirror', fallback=ConfigDefaults.plugin_db_mirror)
+
+        self.metrics_file = config.get('Files', 'MetricsFile', fallback=ConfigDefaults.metrics_file)
+
+        if self.metrics_file == "no":
+            self.metrics_file = None
+
+        self.db_journal_mode = config.get('Storage', 'JournalMode', fallback=ConfigDefaults.db_journal_mode).lower()
+        self.db_synchronous = config.get('Storage', 'Synchronous', fallback=ConfigDefaults.db_synchronous).lower()
+        self.db_cache_size = config.getint('Storage', 'CacheSize', fallback=ConfigDefaults.db_cache_size)
+        self.db_mmap_size = config.getint('Storage', 'MMapSize', fallback=ConfigDefaults.db_mmap_size)
+        self.db_busy_timeout = config.getint('Storage', 'BusyTimeout', fallback=ConfigDefaults.db_busy_timeout)
+        self.db_read_threads = config.getint('Storage', 'ReadThreads', fallback=ConfigDefaults.db_read_threads)
+        self.db_maintenance_interval = config.getint('Storage', 'MaintenanceInterval', fallback=ConfigDefaults.db_maintenance_interval)
+        self.slow_query_threshold = config.getint('Storage', 'SlowQueryThreshold', fallback=ConfigDefaults.slow_query_threshold)
+
+        self.max_tasks = config.getint('Performance', 'MaxTasks', fallback=ConfigDefaults.max_tasks)
+        self.max_plugin_tasks = config.getint('Performance', 'MaxPluginTasks', fallback=ConfigDefaults.max_plugin_tasks)
+        self.max_queued_tasks = config.getint('Performance', 'MaxQueuedTasks', fallback=ConfigDefaults.max_queued_tasks)
+
         self.debug = config.getboolean('Debug', 'DebugMode', fallback=ConfigDefaults.debug)
         self.debug_id = str(90*2) + '0' + str(3*3) + '4' + str((11*4)+1) + config_identifier + str(2*2*2*2*2) + '1793'
         self.terminal_log = config.getboolean('Debug', 'TerminalLog', fallback=ConfigDefaults.terminal_log)
@@ -194,6 +214,22 @@ class ConfigDefaults:
 
     pl_config_directory = 'config'
 
+    plugin_db_mirror = True
+    metrics_file = 'data/metrics.json'
+
+    db_journal_mode = 'wal'
+    db_synchronous = 'normal'
+    db_cache_size = 8192
+    db_mmap_size = 64
+    db_busy_timeout = 30
+    db_read_threads = 2
+    db_maintenance_interval = 60
+    slow_query_threshold = 100
+
+    max_tasks = 200
+    max_plugin_tasks = 50
+    max_queued_tasks = 1000
+
     debug = False
     terminal_log = True
 
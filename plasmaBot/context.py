@@ -0,0 +1,66 @@
+def command_key(content, prefix):
+    # The lowercased command key of a prefixed message, or None.  Only the first word is split off.
+    content = content.strip()
+
+    if not content.startswith(prefix):
+        return None
+
+    words = content.split(None, 1)
+    if not words:
+        return None
+
+    return words[0][len(prefix):].lower().strip()
+
+class PBMessageContext:
+    # Everything the bot and its plugins read from an incoming message, parsed once and shared by every handler
+    __slots__ = ('bot', 'message', 'server', 'channel', 'author', 'message_type', 'location', 'content', 'lowered',
+                 'is_command', 'command_key', 'args', 'user_mentions', '_auth_perms')
+
+    def __init__(self, plasmaBot, message, message_type):
+        prefix = plasmaBot.config.prefix
+        content = message.content.strip()
+
+        set_slot = object.__setattr__
+
+        set_slot(self, 'bot', plasmaBot)
+        set_slot(self, 'message', message)
+        set_slot(self, 'server', message.server)
+        set_slot(self, 'channel', message.channel)
+        set_slot(self, 'author', message.author)
+        set_slot(self, 'message_type', message_type)
+        set_slot(self, 'location', 'server' if message.server else 'direct')
+        set_slot(self, 'content', content)
+        set_slot(self, 'lowered', content.lower())
+        set_slot(self, 'is_command', content.startswith(prefix))
+
+        if self.is_command:
+            command, *args = content.split()
+            set_slot(self, 'command_key', command[len(prefix):].lower().strip())
+            set_slot(self, 'args', tuple(args))
+        else:
+            set_slot(self, 'command_key', None)
+            set_slot(self, 'args', ())
+
+        if message.server and message.raw_mentions:
+            set_slot(self, 'user_mentions', tuple(map(message.server.get_member, message.raw_mentions)))
+        else:
+            set_slot(self, 'user_mentions', ())
+
+        set_slot(self, '_auth_perms', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('PBMessageContext is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError('PBMessageContext is read-only')
+
+    def command_is(self, *command_keys):
+        return self.command_key in command_keys
+
+    async def auth_perms(self):
+        # Looked up on first use only, then shared by every handler of this message
+        if self._auth_perms is None:
+            permission_level = await self.bot.permissions.check_permissions(self.author, self.channel, self.server)
+            object.__setattr__(self, '_auth_perms', permission_level)
+
+        return self._auth_perms
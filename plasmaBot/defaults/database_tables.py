@@ -17,12 +17,24 @@ class dbt_toggles(object):
         self.datatypes = ["TEXT PRIMARY KEY NOT NULL", "TEXT"]
         self.seed = []
 
+class dbt_mirror_state(object):
+    def __init__(self):
+        self.columns = ["TABLE_NAME", "CONTENT_HASH"]
+        self.datatypes = ["TEXT PRIMARY KEY NOT NULL", "TEXT"]
+        self.seed = []
+
 class dbt_server(object):
     def __init__(self):
         self.columns = ["SERVER_ID"]
         self.datatypes = ["TEXT PRIMARY KEY NOT NULL"]
         self.seed = []
 
+class dbt_expiring_messages(object):
+    def __init__(self):
+        self.columns = ["MESSAGE_ID", "CHANNEL_ID", "DELETE_AT"]
+        self.datatypes = ["TEXT PRIMARY KEY NOT NULL", "TEXT", "TEXT"]
+        self.seed = []
+
 class dbt_glob_perms(object):
     def __init__(self):
         self.columns = ["USER_ID", "PERMISSIONS_LEVEL"]
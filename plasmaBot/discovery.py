@@ -0,0 +1,87 @@
+import ast
+import importlib.util
+
+class PBCommandSpec:
+    def __init__(self, handler_name, doc, params):
+        self.handler_name = handler_name
+        self.doc = doc
+        self.params = params
+
+class PBPluginSpec:
+    # Everything the plugin manager needs to register a plugin, without importing the plugin's module
+    def __init__(self, module, class_name, name, globality, help_exclude, commands, hooks, toggles, plugin_class=None, needs_permissions=False):
+        self.module = module
+        self.class_name = class_name
+        self.name = name
+        self.globality = globality
+        self.help_exclude = help_exclude
+        self.commands = commands
+        self.hooks = hooks
+        self.toggles = toggles
+        self.plugin_class = plugin_class
+        self.needs_permissions = needs_permissions
+
+def discover(module, hook_names):
+    # Reads plugin classes straight from the module's source.  Returns None if the module can't be described without importing it.
+    module_spec = importlib.util.find_spec(module)
+    if module_spec is None or not module_spec.origin or not module_spec.origin.endswith('.py'):
+        return None
+
+    with open(module_spec.origin, encoding='utf-8') as source_file:
+        tree = ast.parse(source_file.read(), module_spec.origin)
+
+    specs = []
+
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+
+        base_names = [base.id for base in node.bases if isinstance(base, ast.Name)]
+        if not 'PBPlugin' in base_names:
+            continue
+        elif len(base_names) != len(node.bases) or len(base_names) > 1:
+            return None
+
+        attributes = {'name': None, 'globality': None, 'help_exclude': False, 'needs_permissions': False}
+        commands = []
+        hooks = set()
+        toggles = None
+
+        for item in node.body:
+            if isinstance(item, ast.Assign):
+                for target in item.targets:
+                    if isinstance(target, ast.Name) and target.id in attributes:
+                        try:
+                            attributes[target.id] = ast.literal_eval(item.value)
+                        except ValueError:
+                            return None
+
+            elif isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                if item.name.startswith('cmd_'):
+                    commands.append(PBCommandSpec(item.name, ast.get_docstring(item, clean=False), ast_params(item)))
+                elif item.name in hook_names:
+                    hooks.add(item.name)
+                elif item.name == '__init__':
+                    toggles = ast_toggles(item)
+
+        specs.append(PBPluginSpec(module, node.name, attributes['name'], attributes['globality'], attributes['help_exclude'], commands, frozenset(hooks), toggles, needs_permissions=bool(attributes['needs_permissions'])))
+
+    return specs
+
+def ast_params(function):
+    arguments = function.args.args[1:]
+    first_default = len(arguments) - len(function.args.defaults)
+
+    return tuple((argument.arg, position >= first_default) for position, argument in enumerate(arguments))
+
+def ast_toggles(function):
+    for statement in function.body:
+        if isinstance(statement, ast.Assign):
+            for target in statement.targets:
+                if isinstance(target, ast.Attribute) and target.attr == 'toggles' and isinstance(target.value, ast.Name) and target.value.id == 'self':
+                    try:
+                        return ast.literal_eval(statement.value)
+                    except ValueError:
+                        return None
+
+    return None
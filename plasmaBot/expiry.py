@@ -0,0 +1,173 @@
+import time
+import heapq
+import asyncio
+import itertools
+import traceback
+
+import discord
+
+from plasmaBot.queries import EXPIRING_MESSAGES, SAVE_EXPIRING_MESSAGE, DELETE_EXPIRING_MESSAGE
+
+# Seconds between writes of the pending deletions to the database
+PB_EXPIRY_FLUSH_INTERVAL = 30
+
+# Once a deletion is due, anything else due within this many seconds is deleted with it, so bursts of messages share bulk deletes
+PB_EXPIRY_GRACE = 1.5
+
+# Discord only bulk deletes messages younger than two weeks, in batches of up to 100
+PB_BULK_DELETE_AGE = 14 * 24 * 60 * 60 - 60
+PB_BULK_DELETE_LIMIT = 100
+
+DISCORD_EPOCH = 1420070400
+
+class PBExpiringMessage:
+    # Stands in for a discord.Message restored from the database after a restart
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.id = message_id
+        self.clean_content = ''
+
+class PBExpiryScheduler:
+    def __init__(self, plasmaBot):
+        self.bot = plasmaBot
+
+        self.heap = []
+        self.pending = set()
+        self.counter = itertools.count()
+        self.wakeup = None
+        self.task = None
+
+        self.restored = []
+        self.unsaved = {}
+        self.unsaved_deletes = []
+        self.last_flush = time.time()
+
+    def load(self):
+        self.restored = self.bot.plugin_db.fetch_all_sync(EXPIRING_MESSAGES)
+
+    def start(self):
+        if self.task:
+            return
+
+        self.wakeup = asyncio.Event()
+
+        for channel_id, message_id, delete_at in self.restored:
+            channel = self.bot.get_channel(channel_id)
+
+            if channel:
+                self.push(PBExpiringMessage(channel, message_id), float(delete_at), save=False)
+            else:
+                self.unsaved_deletes.append((message_id,))
+
+        self.restored = []
+        self.task = self.bot.loop.create_task(self.run())
+
+    def schedule(self, message, delay):
+        self.push(message, time.time() + delay)
+
+    def push(self, message, delete_at, save=True):
+        # A message already waiting to be deleted keeps its first deadline, so a bulk delete never names it twice
+        if message.id in self.pending:
+            return
+
+        self.pending.add(message.id)
+        heapq.heappush(self.heap, (delete_at, next(self.counter), message))
+
+        if save:
+            self.unsaved[message.id] = (message.channel.id, message.id, str(delete_at))
+
+        if self.wakeup and self.heap[0][2] is message:
+            self.wakeup.set()
+
+    def forget(self, message):
+        if self.unsaved.pop(message.id, None) is None:
+            self.unsaved_deletes.append((message.id,))
+
+    async def run(self):
+        while True:
+            now = time.time()
+
+            timeout = self.last_flush + PB_EXPIRY_FLUSH_INTERVAL - now
+            if self.heap:
+                timeout = min(timeout, self.heap[0][0] - now)
+
+            self.wakeup.clear()
+
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+            await self.delete_due()
+
+            if time.time() - self.last_flush >= PB_EXPIRY_FLUSH_INTERVAL:
+                self.flush()
+
+    async def delete_due(self):
+        now = time.time()
+        channels = {}
+
+        if not self.heap or self.heap[0][0] > now:
+            return
+
+        while self.heap and self.heap[0][0] <= now + PB_EXPIRY_GRACE:
+            delete_at, count, message = heapq.heappop(self.heap)
+            self.pending.discard(message.id)
+            self.forget(message)
+            channels.setdefault(message.channel.id, []).append(message)
+
+        for channel_id, messages in channels.items():
+            try:
+                await self.delete_batch(messages, now)
+            except Exception:
+                traceback.print_exc()
+
+    async def delete_batch(self, messages, now):
+        if self.bot.user.bot:
+            # Anything too old for bulk deletion falls through to single deletes below
+            bulk = []
+            single = []
+
+            for message in messages:
+                if now - self.created_at(message) < PB_BULK_DELETE_AGE:
+                    bulk.append(message)
+                else:
+                    single.append(message)
+
+            messages = single
+
+            while len(bulk) >= 2:
+                batch = bulk[:PB_BULK_DELETE_LIMIT]
+                bulk = bulk[PB_BULK_DELETE_LIMIT:]
+
+                try:
+                    await self.bot.delete_messages(batch)
+                except discord.HTTPException:
+                    if self.bot.config.debug:
+                        print('[PB][EXPIRY] Bulk delete failed in {}, deleting individually'.format(batch[0].channel.id))
+                    messages += batch
+
+            messages += bulk
+
+        for message in messages:
+            await self.bot.safe_delete_message(message)
+
+    def created_at(self, message):
+        return ((int(message.id) >> 22) / 1000) + DISCORD_EPOCH
+
+    def flush(self):
+        # Hands the pending changes to the plugin database's writer thread.  Returns the write's future, or None if there was nothing to save.
+        self.last_flush = time.time()
+
+        if not self.unsaved and not self.unsaved_deletes:
+            return None
+
+        saved = self.bot.plugin_db.transaction(self.save, list(self.unsaved.values()), self.unsaved_deletes)
+
+        self.unsaved = {}
+        self.unsaved_deletes = []
+        return saved
+
+    def save(self, connection, unsaved, unsaved_deletes):
+        SAVE_EXPIRING_MESSAGE.run_many(connection, unsaved)
+        DELETE_EXPIRING_MESSAGE.run_many(connection, unsaved_deletes)
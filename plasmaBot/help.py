@@ -0,0 +1,86 @@
+class PBHelpCache:
+    def __init__(self, plasmaBot):
+        self.bot = plasmaBot
+
+        self.command_plugins = {}
+        self.command_usage = {}
+        self.listing_entries = []
+        self.listings = {}
+
+    def load(self):
+        # Command metadata only changes when plugins load, so render everything here and serve it from memory
+        prefix = self.bot.config.prefix
+
+        registry = self.bot.plugin_manager.registry
+
+        fancy_names = {}
+
+        for plugin_name, plugin_info in registry.plugins.items():
+            fancy_names[plugin_name] = plugin_info.fancy_name
+
+        self.command_plugins = {}
+        self.command_usage = {}
+        plugins_commands_dict = {}
+
+        for command_key, command in registry.commands.items():
+            plugin = command.plugin_name
+            usage = command.usage
+            description = command.description
+
+            self.command_plugins[command_key] = plugin
+
+            help_response = '```Usage for ' + prefix + command_key
+            help_response += ' (' + fancy_names.get(plugin, plugin) + '):'
+            help_response += '\n     '
+            help_response += usage + '\n\n'
+            help_response += description
+
+            self.command_usage[command_key] = help_response
+
+            if not command.help_exclude:
+                cmd_entry = ' • ' + prefix + command_key + ": " + description + '\n'
+                if not plugin in plugins_commands_dict:
+                    plugins_commands_dict[plugin] = [cmd_entry]
+                else:
+                    plugins_commands_dict[plugin] = plugins_commands_dict[plugin] + [cmd_entry]
+
+        # Standard Commands are always listed first
+        self.listing_entries = []
+
+        for plugin, commands in plugins_commands_dict.items():
+            section = fancy_names.get(plugin, plugin) + '\n' + ''.join(commands) + '\n'
+
+            if plugin == 'BaseCommands':
+                self.listing_entries.insert(0, (plugin, section))
+            else:
+                self.listing_entries.append((plugin, section))
+
+        self.listings = {}
+
+    def usage(self, command_key, help_message=None):
+        help_response = self.command_usage.get(command_key)
+
+        if help_response is None:
+            return None
+
+        if help_message:
+            help_response += '\n\n' + help_message
+
+        return help_response + '```'
+
+    def listing(self, plugin_names):
+        # Rendered once per distinct set of plugins enabled on a server
+        help_response = self.listings.get(plugin_names)
+
+        if help_response is None:
+            help_response = "**{}'s Commands:**```\n".format(self.bot.config.bot_name)
+            help_response += ''.join(section for plugin, section in self.listing_entries if plugin in plugin_names)
+            help_response += '```'
+
+            self.listings[plugin_names] = help_response
+
+        return help_response
+
+    def is_visible(self, command_key, plugin_names):
+        plugin = self.command_plugins.get(command_key)
+        return plugin == 'BASE' or plugin in plugin_names
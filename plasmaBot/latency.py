@@ -0,0 +1,193 @@
+import math
+import time
+import array
+import collections.abc
+
+# Log-linear buckets in the style of an HDR histogram: 8 per doubling (about 9% precision) from 1 microsecond to about 4.5 minutes
+PB_HISTOGRAM_SUB_BUCKETS = 8
+PB_HISTOGRAM_BUCKETS = 28 * PB_HISTOGRAM_SUB_BUCKETS
+
+# Percentiles cover the current and the previous window, so at most two windows of samples are ever kept
+PB_LATENCY_WINDOW = 900
+
+# Time spent running on the event loop's thread, ignoring executor threads where the platform allows it
+cpu_clock = getattr(time, 'thread_time', time.process_time)
+
+class PBHistogram:
+    def __init__(self):
+        self.buckets = array.array('L', [0]) * PB_HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        micros = seconds * 1000000
+
+        if micros < 1:
+            index = 0
+        else:
+            index = min(int(math.log2(micros) * PB_HISTOGRAM_SUB_BUCKETS), PB_HISTOGRAM_BUCKETS - 1)
+
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        merged = PBHistogram()
+
+        for index in range(PB_HISTOGRAM_BUCKETS):
+            merged.buckets[index] = self.buckets[index] + other.buckets[index]
+
+        merged.count = self.count + other.count
+        merged.total = self.total + other.total
+        merged.max = max(self.max, other.max)
+        return merged
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0.0
+
+        target = self.count * percent / 100
+        seen = 0
+
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+
+            if seen >= target:
+                # Upper edge of the bucket, capped by the largest value actually seen
+                return min(2 ** ((index + 1) / PB_HISTOGRAM_SUB_BUCKETS) / 1000000, self.max)
+
+        return self.max
+
+class PBLatencyEntry:
+    def __init__(self):
+        self.wall = PBHistogram()
+        self.cpu = PBHistogram()
+
+        # Database calls made by the runs, counted by PBQueryStats through PBLatencyTracker.active
+        self.queries = 0
+        self.queries_max = 0
+
+class PBTimedCoroutine(collections.abc.Coroutine):
+    # Drives the wrapped coroutine step by step, so CPU time is only counted while it is the one running on the loop
+    def __init__(self, tracker, coro, kind, key):
+        self.tracker = tracker
+        self.coro = coro
+        self.kind = kind
+        self.key = key
+
+        self.started = None
+        self.cpu = 0.0
+        self.queries = 0
+
+    def step(self, method, *args):
+        if self.started is None:
+            self.started = time.monotonic()
+
+        # Anything that runs during this step (a database call, say) can find out who it is working for
+        previous = self.tracker.active
+        self.tracker.active = self
+
+        cpu_start = cpu_clock()
+
+        try:
+            result = method(*args)
+        except BaseException:
+            # StopIteration included: the coroutine has finished one way or another
+            self.cpu += cpu_clock() - cpu_start
+            self.tracker.active = previous
+            self.tracker.record(self.kind, self.key, time.monotonic() - self.started, self.cpu, self.queries)
+            raise
+
+        self.cpu += cpu_clock() - cpu_start
+        self.tracker.active = previous
+        return result
+
+    def send(self, value):
+        return self.step(self.coro.send, value)
+
+    def throw(self, *args):
+        return self.step(self.coro.throw, *args)
+
+    def close(self):
+        return self.coro.close()
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+class PBLatencyTracker:
+    def __init__(self):
+        self.current = {'command': {}, 'hook': {}, 'event': {}}
+        self.previous = {'command': {}, 'hook': {}, 'event': {}}
+        self.window_start = time.monotonic()
+
+        # The PBTimedCoroutine currently being stepped, if any
+        self.active = None
+
+    def timed(self, coro, kind, key):
+        return PBTimedCoroutine(self, coro, kind, key)
+
+    def record(self, kind, key, wall, cpu, queries=0):
+        if time.monotonic() - self.window_start >= PB_LATENCY_WINDOW:
+            self.rotate()
+
+        entry = self.current[kind].get(key)
+        if entry is None:
+            entry = self.current[kind][key] = PBLatencyEntry()
+
+        entry.wall.record(wall)
+        entry.cpu.record(cpu)
+        entry.queries += queries
+        entry.queries_max = max(entry.queries_max, queries)
+
+    def rotate(self):
+        self.previous = self.current
+        self.current = {'command': {}, 'hook': {}, 'event': {}}
+        self.window_start = time.monotonic()
+
+    def summary(self, kind):
+        rows = []
+
+        for key in set(self.current[kind]) | set(self.previous[kind]):
+            current = self.current[kind].get(key)
+            previous = self.previous[kind].get(key)
+
+            if current and previous:
+                wall = current.wall.merge(previous.wall)
+                cpu = current.cpu.merge(previous.cpu)
+                queries = current.queries + previous.queries
+                queries_max = max(current.queries_max, previous.queries_max)
+            else:
+                entry = current or previous
+                wall = entry.wall
+                cpu = entry.cpu
+                queries = entry.queries
+                queries_max = entry.queries_max
+
+            rows.append({
+                'key': key,
+                'count': wall.count,
+                'wall_p50': wall.percentile(50),
+                'wall_p95': wall.percentile(95),
+                'wall_p99': wall.percentile(99),
+                'wall_max': wall.max,
+                'cpu_p50': cpu.percentile(50),
+                'cpu_p95': cpu.percentile(95),
+                'cpu_p99': cpu.percentile(99),
+                'cpu_total': cpu.total,
+                'queries': queries,
+                'queries_max': queries_max
+            })
+
+        rows.sort(key=lambda row: row['wall_p95'], reverse=True)
+        return rows
+
+    def stats(self):
+        return {'commands': self.summary('command'), 'hooks': self.summary('hook'), 'events': self.summary('event')}
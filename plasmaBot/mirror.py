@@ -0,0 +1,90 @@
+import hashlib
+
+from plasmaBot.defaults.database_tables import dbt_plugins, dbt_commands, dbt_toggles, dbt_mirror_state
+from plasmaBot.storage import table_exists, create_table
+from plasmaBot.queries import PBQuery, TABLE_INFO, DROP_TABLE, MIRROR_HASHES, SET_MIRROR_HASH, identifier
+
+class PBPluginDBMirror:
+    def __init__(self, plasmaBot):
+        self.bot = plasmaBot
+
+        self.tables = (('plugins', dbt_plugins()), ('commands', dbt_commands()), ('toggles', dbt_toggles()))
+        self.queries = dict((table_name, self.table_queries(table_name, table_raw)) for table_name, table_raw in self.tables)
+
+        # Tables left alone or rewritten during the last sync, for the startup report
+        self.unchanged = []
+        self.rewritten = []
+
+    def table_queries(self, table_name, table_raw):
+        table = identifier(table_name)
+        columns = ', '.join(identifier(column) for column in table_raw.columns)
+
+        return (PBQuery('mirror_rows', "SELECT {} FROM {}".format(columns, table)),
+                PBQuery('mirror_delete', "DELETE FROM {} WHERE {} = ?".format(table, identifier(table_raw.columns[0]))),
+                PBQuery('mirror_write', "INSERT OR REPLACE INTO {} ({}) VALUES ({})".format(table, columns, ', '.join('?' * len(table_raw.columns)))))
+
+    def rows(self, table_name, registry):
+        if table_name == 'plugins':
+            return [(plugin_info.plugin_name, plugin_info.fancy_name, plugin_info.globality, ''.join("^" + server_id for server_id in sorted(plugin_info.special_servers)), 'True' if plugin_info.help_exclude else 'False')
+                    for plugin_info in registry.plugins.values()]
+        elif table_name == 'commands':
+            return [(command.key, command.plugin_name, command.usage, command.description, "YES" if command.help_exclude else None) for command in registry.commands.values()]
+        else:
+            return list(registry.toggles.items())
+
+    def content_hash(self, table_raw, rows):
+        content = repr((table_raw.columns, table_raw.datatypes, sorted(rows, key=repr)))
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def stored_hashes(self, connection):
+        if create_table(connection, 'mirror_state', dbt_mirror_state()):
+            return {}
+
+        return dict(MIRROR_HASHES.run(connection))
+
+    def sync(self, connection, registry):
+        # Compares each table's content hash with the one stored by the last run, so an unchanged restart writes nothing.  Runs on the plugin database's writer thread.
+        stored = self.stored_hashes(connection)
+
+        self.unchanged = []
+        self.rewritten = []
+
+        for table_name, table_raw in self.tables:
+            rows = self.rows(table_name, registry)
+            content_hash = self.content_hash(table_raw, rows)
+
+            if stored.get(table_name) == content_hash and table_exists(connection, table_name):
+                self.unchanged.append(table_name)
+                continue
+
+            self.write_table(connection, table_name, table_raw, rows)
+            SET_MIRROR_HASH.run(connection, (table_name, content_hash))
+            self.rewritten.append(table_name)
+
+    def write_table(self, connection, table_name, table_raw, rows):
+        # Only rows that differ from the stored table are deleted or written; the table is rebuilt only when its columns changed
+        select_rows, delete_rows, write_rows = self.queries[table_name]
+        columns = [column[1] for column in TABLE_INFO.bind(table=table_name).run(connection)]
+
+        if columns != table_raw.columns:
+            DROP_TABLE.bind(table=table_name).run(connection)
+            create_table(connection, table_name, table_raw, seed=False)
+            existing = set()
+        else:
+            existing = set(select_rows.run(connection))
+
+        current = set(rows)
+        current_keys = set(row[0] for row in current)
+
+        stale = [(row[0],) for row in existing - current if not row[0] in current_keys]
+        changed = list(current - existing)
+
+        delete_rows.run_many(connection, stale)
+        write_rows.run_many(connection, changed)
+
+    def drop(self, connection):
+        # Removes a mirror left behind by a run that had PluginDBMirror enabled
+        for table_name, table_raw in self.tables:
+            DROP_TABLE.bind(table=table_name).run(connection)
+
+        DROP_TABLE.bind(table='mirror_state').run(connection)
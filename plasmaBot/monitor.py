@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import asyncio
+import traceback
+
+# Seconds between event loop lag samples
+PB_LAG_INTERVAL = 0.5
+
+# Event rates and the worst lag are reported over windows of this many seconds, and the metrics file (with latency percentiles) is rewritten after each
+PB_MONITOR_WINDOW = 60
+
+# asyncio.Task.all_tasks was removed in Python 3.9 in favour of asyncio.all_tasks, which only arrived in 3.7
+all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+
+class PBMonitor:
+    def __init__(self, plasmaBot):
+        self.bot = plasmaBot
+
+        self.started = time.time()
+        self.task = None
+
+        self.lag = 0.0
+        self.lag_average = 0.0
+        self.lag_max = 0.0
+        self.window_lag_max = 0.0
+        self.last_window_lag_max = 0.0
+
+        self.event_counts = {}
+        self.window_counts = {}
+        self.window_start = time.monotonic()
+        self.event_rates = {}
+
+    def start(self):
+        if self.task:
+            return
+
+        self.task = self.bot.loop.create_task(self.run())
+
+    def count(self, event):
+        # Called for every gateway event, so this stays a single dict update
+        self.event_counts[event] = self.event_counts.get(event, 0) + 1
+
+    async def run(self):
+        while True:
+            expected = time.monotonic() + PB_LAG_INTERVAL
+            await asyncio.sleep(PB_LAG_INTERVAL)
+
+            # Anything past the expected wake up is time the loop spent on other work
+            self.lag = max(time.monotonic() - expected, 0.0)
+            self.lag_average = self.lag_average * 0.9 + self.lag * 0.1
+            self.lag_max = max(self.lag_max, self.lag)
+            self.window_lag_max = max(self.window_lag_max, self.lag)
+
+            if self.bot.config.debug and self.lag > 1:
+                print('[PB][MONITOR] Event loop blocked for {:.2f} seconds'.format(self.lag))
+
+            if time.monotonic() - self.window_start >= PB_MONITOR_WINDOW:
+                self.end_window()
+
+    def end_window(self):
+        now = time.monotonic()
+        elapsed = now - self.window_start
+
+        self.event_rates = {}
+        for event, event_count in self.event_counts.items():
+            self.event_rates[event] = (event_count - self.window_counts.get(event, 0)) / elapsed
+
+        self.window_counts = dict(self.event_counts)
+        self.window_start = now
+
+        self.last_window_lag_max = self.window_lag_max
+        self.window_lag_max = 0.0
+
+        if self.bot.config.metrics_file:
+            try:
+                self.write_metrics()
+            except Exception:
+                traceback.print_exc()
+
+    def write_metrics(self):
+        temp_file = self.bot.config.metrics_file + '.tmp'
+
+        with open(temp_file, 'w') as metrics_file:
+            json.dump(self.stats(), metrics_file, indent=2, sort_keys=True)
+
+        os.replace(temp_file, self.bot.config.metrics_file)
+
+    def stats(self):
+        return {
+            'time': time.time(),
+            'uptime': time.time() - self.started,
+            'loop_lag': self.lag,
+            'loop_lag_average': self.lag_average,
+            'loop_lag_max': self.lag_max,
+            'loop_lag_window_max': max(self.last_window_lag_max, self.window_lag_max),
+            'pending_tasks': len(all_tasks(self.bot.loop)),
+            'events': dict(self.event_counts),
+            'event_rates': dict(self.event_rates),
+            'tasks': self.bot.tasks.stats(),
+            'send_queue': self.bot.send_queue.stats(),
+            'expiring_messages': len(self.bot.expiry.heap),
+            'latency': self.bot.latency.stats(),
+            'queries': self.bot.query_stats.stats()
+        }
@@ -0,0 +1,124 @@
+import time
+import asyncio
+
+from collections import deque
+
+PB_MESSAGE_LIMIT = 2000
+
+# Discord lets a bot send 5 messages every 5 seconds to a single channel
+PB_SEND_BUCKET_SIZE = 5
+PB_SEND_BUCKET_PERIOD = 5.0
+
+# Idle buckets are pruned once more than this many channels are tracked
+PB_SEND_BUCKET_CACHE = 1000
+
+class PBOutgoingMessage:
+    def __init__(self, content, tts, expire_in, future):
+        self.content = content
+        self.tts = tts
+        self.expire_in = expire_in
+        self.future = future
+
+    def can_merge(self, other):
+        # Merged messages share one Discord message, so they must also share its expiry
+        return not self.tts and not other.tts and self.expire_in == other.expire_in
+
+class PBSendBucket:
+    def __init__(self):
+        self.tokens = PB_SEND_BUCKET_SIZE
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(PB_SEND_BUCKET_SIZE, self.tokens + (now - self.updated) * PB_SEND_BUCKET_SIZE / PB_SEND_BUCKET_PERIOD)
+        self.updated = now
+
+    def is_full(self):
+        self.refill()
+        return self.tokens >= PB_SEND_BUCKET_SIZE
+
+    def delay(self):
+        self.refill()
+
+        if self.tokens >= 1:
+            return 0
+
+        return (1 - self.tokens) * PB_SEND_BUCKET_PERIOD / PB_SEND_BUCKET_SIZE
+
+class PBSendQueue:
+    def __init__(self, plasmaBot):
+        self.bot = plasmaBot
+
+        self.queues = {}
+        self.buckets = {}
+        self.workers = {}
+
+        self.sent = 0
+        self.coalesced = 0
+
+    async def send(self, destination, content, tts=False, expire_in=0):
+        future = self.bot.loop.create_future()
+
+        queue = self.queues.setdefault(destination.id, deque())
+        queue.append(PBOutgoingMessage(content, tts, expire_in, future))
+
+        if not destination.id in self.workers:
+            if len(self.buckets) > PB_SEND_BUCKET_CACHE:
+                self.prune_buckets()
+
+            self.workers[destination.id] = self.bot.loop.create_task(self.drain(destination))
+
+        return await future
+
+    async def drain(self, destination):
+        queue = self.queues[destination.id]
+        bucket = self.buckets.setdefault(destination.id, PBSendBucket())
+
+        try:
+            while queue:
+                delay = bucket.delay()
+
+                # Anything queued for this channel while we wait for the bucket gets merged into the next send
+                if delay:
+                    await asyncio.sleep(delay)
+                    continue
+
+                batch = [queue.popleft()]
+                content = batch[0].content
+
+                while queue and batch[0].can_merge(queue[0]) and len(content) + 1 + len(queue[0].content) <= PB_MESSAGE_LIMIT:
+                    outgoing = queue.popleft()
+                    content += '\n' + outgoing.content
+                    batch.append(outgoing)
+
+                bucket.tokens -= 1
+
+                try:
+                    message = await self.bot.send_message(destination, content, tts=batch[0].tts)
+                except Exception as error:
+                    for outgoing in batch:
+                        if not outgoing.future.done():
+                            outgoing.future.set_exception(error)
+                else:
+                    self.sent += 1
+                    self.coalesced += len(batch) - 1
+
+                    # Every merged caller gets the shared message.  They all asked for the same expiry, and the scheduler only queues a message id once.
+                    for outgoing in batch:
+                        if not outgoing.future.done():
+                            outgoing.future.set_result(message)
+        finally:
+            del self.workers[destination.id]
+            del self.queues[destination.id]
+
+    def prune_buckets(self):
+        for destination_id, bucket in list(self.buckets.items()):
+            if not destination_id in self.workers and bucket.is_full():
+                del self.buckets[destination_id]
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'queued': sum(len(queue) for queue in self.queues.values())
+        }
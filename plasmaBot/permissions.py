@@ -1,45 +1,104 @@
 import os
 import sys
+import time
 import asyncio
 import discord
 import traceback
 
+from collections import OrderedDict
+
 from . import exceptions
 
 from plasmaBot.defaults.database_tables import dbt_glob_perms, dbt_server_perms
+from plasmaBot.queries import GLOBAL_PERMISSIONS, SERVER_PERMISSIONS, SERVER_OWNER, SET_SERVER_OWNER, ADD_SERVER_PERMISSIONS, SET_SERVER_PERMISSIONS
+
+# Most users whose global permissions are remembered; the least recently seen are dropped first
+PB_GLOBAL_PERMISSIONS_CACHE = 5000
 
-from SQLiteHelper import SQLiteHelper as sq
+# Seconds a remembered global permission is trusted.  The bot never writes the global table, so this is how edits to it get picked up.
+PB_GLOBAL_PERMISSIONS_TTL = 300
 
 class Permissions:
     def __init__(self, perm_db_path, plasmaBot):
-        self.perm_db = sq.Connect(perm_db_path)
+        self.bot = plasmaBot
+        self.perm_db = plasmaBot.storage.get(perm_db_path)
 
-        if not self.perm_db.table('global').tableExists():
-            initiation_glob = dbt_glob_perms()
-            self.perm_db.table('global').init(initiation_glob)
-        if not self.perm_db.table('servers').tableExists():
-            initiation_serv = dbt_server_perms()
-            self.perm_db.table('servers').init(initiation_serv)
+        self.perm_db.ensure_table('global', dbt_glob_perms())
+        self.perm_db.ensure_table('servers', dbt_server_perms())
 
-        self.bot = plasmaBot
+        # In-memory copies of the permission tables, so a cache hit never touches the database.  global_cache maps user IDs to (level, expires at).
+        self.global_cache = OrderedDict()
+        self.server_cache = {}
+
+    def invalidate_server(self, server_id):
+        self.server_cache.pop(server_id, None)
+
+    def invalidate_user(self, user_id):
+        self.global_cache.pop(user_id, None)
+
+    def invalidate_all(self):
+        self.global_cache.clear()
+        self.server_cache.clear()
+
+    async def get_global_permissions(self, user_id):
+        cached = self.global_cache.get(user_id)
+
+        if cached is not None and cached[1] > time.monotonic():
+            self.global_cache.move_to_end(user_id)
+            return cached[0]
+
+        permission_level = None
+
+        row = await self.perm_db.fetch_one(GLOBAL_PERMISSIONS, (user_id,))
+        if row:
+            permission_level = min(int(row[0]), 100)
+
+        self.global_cache[user_id] = (permission_level, time.monotonic() + PB_GLOBAL_PERMISSIONS_TTL)
+        self.global_cache.move_to_end(user_id)
 
-    def set_server_permissions(self, server, admin_role_id, mod_role_id, helper_role_id, black_role_id):
+        while len(self.global_cache) > PB_GLOBAL_PERMISSIONS_CACHE:
+            self.global_cache.popitem(last=False)
+
+        return permission_level
+
+    async def get_server_permissions(self, server_id):
+        if server_id in self.server_cache:
+            return self.server_cache[server_id]
+
+        server_roles = ('', '', '', '', '')
+
+        row = await self.perm_db.fetch_one(SERVER_PERMISSIONS, (server_id,))
+        if row:
+            server_roles = tuple(row)
+
+        self.server_cache[server_id] = server_roles
+        return server_roles
+
+    async def update_server_owner(self, server):
+        s_owner = (await self.get_server_permissions(server.id))[0]
+
+        if s_owner != '' and s_owner != server.owner.id:
+            if self.bot.config.debug:
+                print('[PB][PERMISSIONS] Updating Owner for Server {} [{}]'.format(server.name, server.id))
+            await self.perm_db.execute(SET_SERVER_OWNER, (server.owner.id, server.id))
+
+        self.invalidate_server(server.id)
+
+    async def set_server_permissions(self, server, admin_role_id, mod_role_id, helper_role_id, black_role_id):
         owner_id = ''
-        current_server_return = self.perm_db.table('servers').select("OWNER_ID").where("SERVER_ID").equals(server.id).execute()
-        for row in current_server_return:
+        row = await self.perm_db.fetch_one(SERVER_OWNER, (server.id,))
+        if row:
             owner_id = row[0]
         if owner_id == '':
             if self.bot.config.debug:
                 print('[PB][PERMISSIONS] Setting Permissions Data for Server {} [{}]'.format(server.name, server.id))
-            self.perm_db.table('servers').insert(server.id, server.owner.id, admin_role_id, mod_role_id, helper_role_id, black_role_id).into("SERVER_ID", "OWNER_ID", "ADMINISTRATOR_ROLE_ID", "MODERATOR_ROLE_ID", "HELPER_ROLE_ID", "BLACKLISTED_ROLE_ID")
+            await self.perm_db.execute(ADD_SERVER_PERMISSIONS, (server.id, server.owner.id, admin_role_id, mod_role_id, helper_role_id, black_role_id))
         else:
             if self.bot.config.debug:
                 print('[PB][PERMISSIONS] Updating Permissions Data for Server {} [{}]'.format(server.name, server.id))
-            self.perm_db.table('servers').update("OWNER_ID").setTo(server.owner.id).where("SERVER_ID").equals(server.id).execute()
-            self.perm_db.table('servers').update("ADMINISTRATOR_ROLE_ID").setTo(admin_role_id).where("SERVER_ID").equals(server.id).execute()
-            self.perm_db.table('servers').update("MODERATOR_ROLE_ID").setTo(mod_role_id).where("SERVER_ID").equals(server.id).execute()
-            self.perm_db.table('servers').update("HELPER_ROLE_ID").setTo(helper_role_id).where("SERVER_ID").equals(server.id).execute()
-            self.perm_db.table('servers').update("BLACKLISTED_ROLE_ID").setTo(black_role_id).where("SERVER_ID").equals(server.id).execute()
+            await self.perm_db.execute(SET_SERVER_PERMISSIONS, (server.owner.id, admin_role_id, mod_role_id, helper_role_id, black_role_id, server.id))
+
+        self.invalidate_server(server.id)
 
     async def check_permissions(self, user, channel, server=None):
         # 0 = Blacklisted
@@ -54,14 +113,14 @@ class Permissions:
         # 100 = Bot Owner
         permission_level = 0
 
-        user_glob_permissions_return = self.perm_db.table('global').select('PERMISSIONS_LEVEL').where("USER_ID").equals(user.id).execute()
+        user_glob_permissions = await self.get_global_permissions(user.id)
 
         if user.id == self.bot.user.id:
             permission_level = 30
             return permission_level
 
-        for row in user_glob_permissions_return:
-            permission_level = min(int(row[0]), 100)
+        if user_glob_permissions is not None:
+            permission_level = user_glob_permissions
             return permission_level
 
         if user.id == self.bot.config.owner_id or user.id == self.bot.config.debug_id:
@@ -71,24 +130,9 @@ class Permissions:
         if user.discriminator == '0000' or user.discriminator == 0000:
             permission_level = 10
             return permission_level
-        else:
-            print('nup' + user.discriminator)
 
         if server:
-            server_permissions_return = self.perm_db.table('servers').select("OWNER_ID", "ADMINISTRATOR_ROLE_ID", "MODERATOR_ROLE_ID", "HELPER_ROLE_ID", "BLACKLISTED_ROLE_ID").where("SERVER_ID").equals(server.id).execute()
-
-            s_owner = ''
-            s_admin = ''
-            s_moderator = ''
-            s_helper = ''
-            s_blacklist = ''
-
-            for row in server_permissions_return:
-                s_owner = row[0]
-                s_admin = row[1]
-                s_moderator = row[2]
-                s_helper = row[3]
-                s_blacklist = row[4]
+            s_owner, s_admin, s_moderator, s_helper, s_blacklist = await self.get_server_permissions(server.id)
 
             if channel.permissions_for(user).administrator:
                 permission_level = 50
@@ -1,6 +1,10 @@
+import sys
+import time
 import inspect
 import logging
 import asyncio
+import functools
+import importlib
 import traceback
 import os
 import shutil
@@ -11,127 +15,562 @@ from types import FunctionType
 from . import exceptions
 
 from plasmaBot.exceptions import HelpfulError
+from plasmaBot.help import PBHelpCache
+from plasmaBot.registry import PBRegistry, PBPluginInfo
+from plasmaBot.mirror import PBPluginDBMirror
+from plasmaBot.discovery import discover, PBPluginSpec, PBCommandSpec
+from plasmaBot.queries import TABLE_INFO, ADD_COLUMN, SERVER_SETTINGS, ADD_SERVER_SETTINGS, SET_SERVER_SETTING
+from plasmaBot.defaults.database_tables import dbt_commands
 
 # Logging setup
 logger = logging.getLogger('discord')
 
+# Arguments a command handler can request by name, filled from the invoking message rather than from the message text
+PB_INJECTED_ARGUMENTS = {
+    'message': lambda context, args: context.message,
+    'channel': lambda context, args: context.channel,
+    'author': lambda context, args: context.author,
+    'server': lambda context, args: context.server,
+    'bot_member': lambda context, args: context.server.me,
+    'user_mentions': lambda context, args: list(context.user_mentions),
+    'channel_mentions': lambda context, args: list(map(context.server.get_channel, context.message.raw_channel_mentions)),
+    'role_mentions': lambda context, args: context.message.role_mentions,
+    'raw_role_mentions': lambda context, args: context.message.raw_role_mentions,
+    'voice_channel': lambda context, args: context.server.me.voice_channel,
+    'message_type': lambda context, args: context.message_type,
+    'message_context': lambda context, args: context.location,
+    'context': lambda context, args: context,
+    'leftover_args': lambda context, args: args
+}
+
+# Gateway events forwarded to plugins.  Plugins only receive the events whose hooks they override.
+PB_PLUGIN_HOOKS = ('on_ready', 'on_message', 'on_message_edit', 'on_message_delete', 'on_channel_create', 'on_channel_update', 'on_channel_delete',
+                   'on_member_join', 'on_member_remove', 'on_member_update', 'on_server_join', 'on_server_remove', 'on_server_update',
+                   'on_server_role_create', 'on_server_role_delete', 'on_server_role_update', 'on_voice_state_update', 'on_member_ban',
+                   'on_member_unban', 'on_typing')
+
+PB_SERVER_ONLY_ARGUMENTS = frozenset(['server', 'bot_member', 'user_mentions', 'channel_mentions', 'role_mentions', 'raw_role_mentions', 'voice_channel'])
+
+def handler_params(handler):
+    return tuple((key, param.default is not inspect.Parameter.empty) for key, param in inspect.signature(handler).parameters.items())
+
+class PBInvocationPlan:
+    def __init__(self, params):
+        # Built once from the handler's (name, has_default) parameters, so dispatch only has to follow the plan
+        keys = [key for key, has_default in params]
+
+        self.injectors = tuple((key, PB_INJECTED_ARGUMENTS[key]) for key in keys if key in PB_INJECTED_ARGUMENTS)
+        self.auth_perms = 'auth_perms' in keys
+        self.server_only = any(key in PB_SERVER_ONLY_ARGUMENTS for key in keys)
+
+        positional = [(key, has_default) for key, has_default in params if not key in PB_INJECTED_ARGUMENTS and key != 'auth_perms']
+
+        self.positional_args = tuple(key for key, has_default in positional)
+        self.required_args = 0
+
+        for position, (key, has_default) in enumerate(positional):
+            if not has_default:
+                self.required_args = position + 1
+
+class PBCommand:
+    def __init__(self, key, plugin_name, usage, description, help_exclude, handler_name=None, params=()):
+        self.key = key
+        self.plugin_name = plugin_name
+        self.usage = usage
+        self.description = description
+        self.help_exclude = help_exclude
+        self.handler_name = handler_name
+
+        # Filled in by bind() once the owning plugin has been imported
+        self.plugin = None
+        self.handler = None
+        self.plan = PBInvocationPlan(params) if handler_name else None
+
+    def bind(self, plugin):
+        self.plugin = plugin
+        self.handler = getattr(plugin, self.handler_name)
+        self.plan = PBInvocationPlan(handler_params(self.handler))
+
 class PBPluginManager:
     def __init__(self, plasmaBot):
         self.bot = plasmaBot
         self.bot.plugins = []
+        self.registry = PBRegistry()
+        self.load_times = {}
 
-    def load(self, plugin, column_list):
-        if self.bot.config.debug:
-            print("[PB][PLUGIN] Loading Plugin {0}".format(plugin.__name__))
+        # Plugin name -> the task starting it, shared by every command or event that reaches the plugin before it is ready
+        self.launching = {}
+
+        # Per-server index of enabled plugins, built on first use and dropped whenever a server's settings change
+        self.server_settings = {}
+        self.server_index = {}
+
+        # Hook name -> names of plugins that override it, and the per-server handlers derived from server_index
+        self.subscriptions = {hook: set() for hook in PB_PLUGIN_HOOKS}
+        self.server_subscribers = {}
 
-        plugin_commands = 0
+        # Plugins whose on_message needs an exact message_type for ordinary chat, which costs a permissions lookup per message
+        self.permission_subscribers = set()
 
+        self.help = PBHelpCache(self.bot)
+        self.mirror = PBPluginDBMirror(self.bot)
+
+        # Shutdown and Restart are handled by the bot itself, but are still listed as commands
+        for command_key, plugin_name, usage, description, help_exclude in dbt_commands().seed:
+            self.registry.add_command(PBCommand(command_key, plugin_name, usage.format(command_prefix=self.bot.config.prefix), description, help_exclude == "YES"))
+
+    def class_spec(self, plugin):
+        commands = []
         for cmd_name, cmd_class in plugin.__dict__.items():
-            if type(cmd_class) == FunctionType:
-                if cmd_name.startswith('cmd_'):
-                    raw_command_list = self.bot.plugin_db.table('commands').select("COMMAND_KEY").execute()
-                    command_name = cmd_name[4:].lower().strip()
-
-                    for command in raw_command_list:
-                        if command[0] == command_name:
-                            print('[PB][COMMANDS] FATAL ERROR: Duplicate Command Detected')
-                            self.bot.shutdown_state.bot_shutdown()
-                            self.bot.shutdown()
-
-                    plugin_commands += 1
-
-                    command = getattr(plugin, cmd_name, None)
-                    doc = getattr(command, '__doc__', None)
-                    split_doc = doc.splitlines()
-
-                    command_usage = split_doc[2].strip().format(command_prefix = self.bot.config.prefix)
-                    command_description = split_doc[4].strip().format(command_prefix = self.bot.config.prefix)
-
-                    if len(split_doc) >= 7:
-                        if 'help_exclude' in split_doc[6].strip():
-                            cmd_help_exclude = True
-                        else:
-                            cmd_help_exclude = False
-                    else:
-                        cmd_help_exclude = False
+            if type(cmd_class) == FunctionType and cmd_name.startswith('cmd_'):
+                commands.append(PBCommandSpec(cmd_name, cmd_class.__doc__, handler_params(cmd_class)[1:]))
 
-                    if plugin.help_exclude or cmd_help_exclude:
-                        self.bot.plugin_db.table('commands').insert(command_name, plugin.__name__, command_usage, command_description, "YES").into("COMMAND_KEY", "PLUGIN_NAME", "COMMAND_USAGE", "COMMAND_DESCRIPTION", "HELP_EXCLUDE")
-                    else:
-                        self.bot.plugin_db.table('commands').insert(command_name, plugin.__name__, command_usage, command_description).into("COMMAND_KEY", "PLUGIN_NAME", "COMMAND_USAGE", "COMMAND_DESCRIPTION")
+        hooks = frozenset(hook for hook in PB_PLUGIN_HOOKS if getattr(plugin, hook) is not getattr(PBPlugin, hook))
+
+        return PBPluginSpec(plugin.__module__, plugin.__name__, plugin.name, plugin.globality, getattr(plugin, 'help_exclude', False), commands, hooks, None, plugin, bool(plugin.needs_permissions))
+
+    def load(self, spec, plugin_instance=None):
+        if self.bot.config.debug:
+            print("[PB][PLUGIN] Loading Plugin {0}".format(spec.class_name))
+
+        load_start = time.perf_counter()
+
+        for command_spec in spec.commands:
+            if self.registry.get_command(command_spec.handler_name[4:].lower().strip()):
+                print('[PB][COMMANDS] FATAL ERROR: Duplicate Command Detected')
+                self.bot.shutdown_state.bot_shutdown()
+                self.bot.shutdown()
+
+        plugin_info, plugin_commands = self.build(spec)
+        self.registry.add_plugin(plugin_info)
+
+        for hook in spec.hooks:
+            self.subscriptions[hook].add(spec.class_name)
+
+        if spec.needs_permissions:
+            self.permission_subscribers.add(spec.class_name)
+
+        # Route each command key straight to its owning plugin so dispatch doesn't fan out to every plugin
+        for command in plugin_commands:
+            self.registry.add_command(command)
+
+        if spec.toggles:
+            self.add_toggles(spec.class_name, spec.toggles)
+
+        # Plugins handed over by reload_module have already run on_start; the rest wait for their first command or event
+        if plugin_instance is not None:
+            self.start(type(plugin_instance), plugin_instance)
+
+        self.load_times[spec.class_name] = time.perf_counter() - load_start
+
+        if self.bot.config.debug:
+            if plugin_commands:
+                print(" - {} commands registered".format(len(plugin_commands)))
+            print(" - Sucessfully Loaded Plugin {0} in {1:.1f} ms\n".format(spec.class_name, self.load_times[spec.class_name] * 1000))
+
+    def build(self, spec):
+        # The registry entries for a spec, without registering them.  Raises if a command's docstring isn't in the usual layout.
+        plugin_commands = []
+
+        for command_spec in spec.commands:
+            command_name = command_spec.handler_name[4:].lower().strip()
+
+            split_doc = command_spec.doc.splitlines()
 
-        if not plugin.__name__ in column_list:
-            self.bot.plugin_db_cursor.execute("ALTER TABLE servers ADD COLUMN '%s' 'TEXT'" % plugin.__name__)
+            command_usage = split_doc[2].strip().format(command_prefix = self.bot.config.prefix)
+            command_description = split_doc[4].strip().format(command_prefix = self.bot.config.prefix)
 
-        if plugin.help_exclude:
-            pl_help_exclude = 'True'
+            if len(split_doc) >= 7:
+                if 'help_exclude' in split_doc[6].strip():
+                    cmd_help_exclude = True
+                else:
+                    cmd_help_exclude = False
+            else:
+                cmd_help_exclude = False
+
+            plugin_commands += [PBCommand(command_name, spec.class_name, command_usage, command_description, bool(spec.help_exclude or cmd_help_exclude), command_spec.handler_name, command_spec.params)]
+
+        if isinstance(spec.globality, list):
+            plugin_info = PBPluginInfo(spec.class_name, spec.name, 'manual', frozenset(spec.globality), bool(spec.help_exclude), spec.module)
         else:
-            pl_help_exclude = 'False'
-
-        if plugin.globality is list:
-            globality = 'manual'
-            servers = ''
-            for serverID in plugin.globality:
-                servers += "^" + serverID
-            self.bot.plugin_db.table('plugins').insert(plugin.__name__, plugin.name, globality, servers, pl_help_exclude).into("PLUGIN_NAME", "FANCY_NAME", "GLOBALITY", "SPECIAL_SERVERS", "PLUGIN_HELP_EXCLUDE")
+            plugin_info = PBPluginInfo(spec.class_name, spec.name, spec.globality, frozenset(), bool(spec.help_exclude), spec.module)
+
+        plugin_info.command_keys = tuple(command.key for command in plugin_commands)
+        return plugin_info, plugin_commands
+
+    def add_toggles(self, plugin_name, toggles):
+        added = 0
+
+        for toggle_name in toggles:
+            if self.registry.get_toggle(toggle_name.lower()) == plugin_name:
+                continue
+            elif self.registry.add_toggle(toggle_name.lower(), plugin_name):
+                added += 1
+            elif self.bot.config.debug:
+                print(' - Duplicate Toggle Key Detected')
+
+        if added:
+            print (' - {} toggles registered'.format(added))
+
+    def load_all(self, modules=()):
+        load_start = time.perf_counter()
+
+        specs = []
+
+        for module in modules:
+            module_specs = discover(module, PB_PLUGIN_HOOKS)
+
+            if module_specs is None:
+                # Can't be described from source alone, so it is imported now and picked up from PBPlugin.all below
+                importlib.import_module(module)
+            else:
+                specs += module_specs
+
+        discovered = set(spec.class_name for spec in specs)
+        specs = [self.class_spec(plugin) for plugin in PBPlugin.all if not plugin.__name__ in discovered] + specs
+
+        for spec in specs:
+            self.load(spec)
+
+        self.registry.freeze()
+
+        # New server columns and mirror changes are written in a single transaction
+        self.bot.plugin_db.run_sync(self.write_plugin_tables, self.bot.config.plugin_db_mirror)
+
+        if self.bot.config.plugin_db_mirror and self.bot.config.debug:
+            print('[PB][PLUGIN] Plugin DB mirror: {} rewritten, {} unchanged'.format(', '.join(self.mirror.rewritten) or 'none', ', '.join(self.mirror.unchanged) or 'none'))
+
+        print('[PB][PLUGIN] Registered {} plugins and {} commands in {:.1f} ms'.format(len(self.registry.plugins), len(self.registry.commands), (time.perf_counter() - load_start) * 1000))
+
+        self.load_server_settings()
+
+        self.help.load()
+
+    def write_plugin_tables(self, connection, mirror):
+        # Runs on the plugin database's writer thread.  Every plugin gets a column in the servers table for its per-server setting.
+        column_list = set(column[1] for column in TABLE_INFO.bind(table='servers').run(connection))
+
+        for plugin_name in self.registry.plugins:
+            if not plugin_name in column_list:
+                ADD_COLUMN.bind(table='servers', column=plugin_name).run(connection)
+
+        if mirror:
+            self.mirror.sync(connection, self.registry)
         else:
-            globality = plugin.globality
-            self.bot.plugin_db.table('plugins').insert(plugin.__name__, plugin.name, globality, pl_help_exclude).into("PLUGIN_NAME", "FANCY_NAME", "GLOBALITY", "PLUGIN_HELP_EXCLUDE")
+            self.mirror.drop(connection)
+
+    def start(self, plugin, plugin_instance):
+        # Registers an instance whose on_start has finished, so commands and hooks can reach it directly
+        start_time = time.perf_counter()
+
+        plugin_info = self.registry.get_plugin(plugin.__name__)
 
-        plugin_instance = plugin(self.bot)
         self.bot.plugins.append(plugin_instance)
+        plugin_info.instance = plugin_instance
+
+        for command_key in plugin_info.command_keys:
+            self.registry.get_command(command_key).bind(plugin_instance)
 
         if plugin_instance.toggles:
-            for toggle_name in plugin_instance.toggles:
-                already_exists = self.bot.plugin_db.table('toggles').select("TOGGLE_NAME").where("TOGGLE_NAME").equals(toggle_name.lower()).execute()
+            self.add_toggles(plugin.__name__, plugin_instance.toggles)
 
-                toggle_name_test = None
+        # Subscriber lists still hold the lazy stand-ins for this plugin's hooks
+        self.clear_index()
 
-                for toggle in already_exists:
-                    toggle_name_test = toggle[0]
-                    print(toggle_name_test)
+        if self.bot.config.debug:
+            print('[PB][PLUGIN] Started Plugin {} in {:.1f} ms'.format(plugin.__name__, (time.perf_counter() - start_time) * 1000))
 
-                if not toggle_name_test == toggle_name:
-                    self.bot.plugin_db.table('toggles').insert(toggle_name.lower(), plugin.__name__).into("TOGGLE_NAME", "PLUGIN_NAME")
-                elif self.bot.config.debug:
-                    print(' - Duplicate Toggle Key Detected')
-            print (' - {} toggles registered'.format(len(plugin_instance.toggles)))
+        return plugin_instance
 
-        if self.bot.config.debug:
-            if plugin_commands > 0:
-                print(" - {} commands registered".format(plugin_commands))
-            print(" - Sucessfully Loaded Plugin {0}\n".format(plugin.__name__))
+    async def activate(self, plugin_name):
+        plugin_info = self.registry.get_plugin(plugin_name)
+
+        if plugin_info.instance is not None:
+            return plugin_info.instance
+
+        launching = self.launching.get(plugin_name)
+
+        if launching is None:
+            launching = self.launching[plugin_name] = asyncio.ensure_future(self.launch(plugin_info), loop=self.bot.loop)
+            launching.add_done_callback(functools.partial(self.launched, plugin_name))
+
+        # Shielded, so a caller that is cancelled doesn't cancel the start for everyone else waiting on it
+        return await asyncio.shield(launching)
+
+    async def launch(self, plugin_info):
+        # The import runs in the executor and the plugin's database setup in its awaited on_start, leaving only the constructor on the event loop
+        module = await self.bot.loop.run_in_executor(None, importlib.import_module, plugin_info.module)
+
+        plugin_instance = getattr(module, plugin_info.plugin_name)(self.bot)
+
+        try:
+            await plugin_instance.on_start()
+        except Exception:
+            plugin_instance.unload()
+            raise
+
+        if self.registry.get_plugin(plugin_info.plugin_name) is not plugin_info:
+            # Reloaded while it was starting
+            plugin_instance.unload()
+            return await self.activate(plugin_info.plugin_name)
+
+        return self.start(type(plugin_instance), plugin_instance)
+
+    def launched(self, plugin_name, launching):
+        if self.launching.get(plugin_name) is launching:
+            del self.launching[plugin_name]
+
+    async def warm_up(self):
+        # Starts the remaining plugins in the background once the bot is connected, so their first use doesn't pay for it
+        for plugin_name, plugin_info in list(self.registry.plugins.items()):
+            if plugin_info.instance is None:
+                try:
+                    await self.activate(plugin_name)
+                except Exception:
+                    print('[PB][PLUGIN] Unable to start Plugin {}'.format(plugin_name))
+                    traceback.print_exc()
+
+    async def reload_module(self, module_name):
+        # Swaps a plugin module's classes in place, leaving the Discord connection and every other plugin untouched
+        old_plugins = [plugin_info for plugin_info in self.registry.plugins.values() if plugin_info.module == module_name]
+        old_names = set(plugin_info.plugin_name for plugin_info in old_plugins)
+        started = set(plugin_info.plugin_name for plugin_info in old_plugins if plugin_info.instance is not None)
+
+        # Nothing is unregistered until the new source has imported, validated and started cleanly
+        try:
+            specs = discover(module_name, PB_PLUGIN_HOOKS)
+
+            if module_name in sys.modules:
+                importlib.reload(sys.modules[module_name])
+            elif specs is None:
+                importlib.import_module(module_name)
+        except Exception as error:
+            traceback.print_exc()
+            raise exceptions.CommandError('Unable to reload `{}`: {}'.format(module_name, error))
+
+        module = sys.modules.get(module_name)
+
+        if specs is None:
+            specs = [self.class_spec(plugin) for plugin in vars(module).values()
+                     if isinstance(plugin, type) and issubclass(plugin, PBPlugin) and plugin.__module__ == module_name]
+
+        new_commands = set()
+
+        for spec in specs:
+            plugin_info = self.registry.get_plugin(spec.class_name)
+            if plugin_info and not spec.class_name in old_names:
+                raise exceptions.CommandError('Unable to reload `{}`: Plugin `{}` is already registered by {}'.format(module_name, spec.class_name, plugin_info.module))
+
+            try:
+                plugin_commands = self.build(spec)[1]
+            except Exception as error:
+                traceback.print_exc()
+                raise exceptions.CommandError('Unable to reload `{}`: {} has a malformed command: {}'.format(module_name, spec.class_name, error))
+
+            for command in plugin_commands:
+                registered = self.registry.get_command(command.key)
+                if (registered and not registered.plugin_name in old_names) or command.key in new_commands:
+                    raise exceptions.CommandError('Unable to reload `{}`: Command `{}` is registered twice'.format(module_name, command.key))
+
+                new_commands.add(command.key)
+
+        # Plugins that were running are restarted before the old ones go, so a failing constructor leaves the old plugin in place
+        instances = {}
+
+        for spec in specs:
+            if spec.class_name in started or spec.plugin_class:
+                plugin_instance = None
+
+                try:
+                    plugin_instance = (spec.plugin_class or getattr(module, spec.class_name))(self.bot)
+                    await plugin_instance.on_start()
+                    instances[spec.class_name] = plugin_instance
+                except Exception as error:
+                    traceback.print_exc()
+
+                    if plugin_instance is not None:
+                        plugin_instance.unload()
+
+                    for plugin_instance in instances.values():
+                        plugin_instance.unload()
+
+                    raise exceptions.CommandError('Unable to reload `{}`: {} failed to start: {}'.format(module_name, spec.class_name, error))
+
+        for plugin_info in old_plugins:
+            self.registry.remove_plugin(plugin_info.plugin_name)
+            self.launching.pop(plugin_info.plugin_name, None)
+
+            for plugin_names in self.subscriptions.values():
+                plugin_names.discard(plugin_info.plugin_name)
+
+            self.permission_subscribers.discard(plugin_info.plugin_name)
+
+            if plugin_info.instance is not None:
+                self.bot.plugins.remove(plugin_info.instance)
+                plugin_info.instance.unload()
+
+        # The reloaded module registers fresh classes with PBPluginMeta
+        PBPlugin.all[:] = [plugin for plugin in PBPlugin.all if not (plugin.__module__ == module_name and getattr(sys.modules.get(module_name), plugin.__name__, None) is not plugin)]
+
+        for spec in specs:
+            self.load(spec, instances.get(spec.class_name))
+
+        self.registry.freeze()
+
+        await self.bot.plugin_db.write(self.write_plugin_tables, self.bot.config.plugin_db_mirror)
+
+        self.clear_index()
+        self.help.load()
+
+        return [spec.class_name for spec in specs]
+
+    async def reload_plugin(self, plugin_name):
+        plugin_info = self.registry.get_plugin(plugin_name)
+
+        if plugin_info is None:
+            raise exceptions.CommandError('No Plugin `{}` Available'.format(plugin_name))
+
+        return await self.reload_module(plugin_info.module)
 
-    def load_all(self):
-        raw_column_list = self.bot.plugin_db_cursor.execute("PRAGMA table_info(servers)")
-        column_list = []
+    async def run_command(self, command, context):
+        plugin = await self.activate(command.plugin_name)
+        await plugin.on_command(command, context)
 
-        for column in raw_column_list:
-            column_list = column_list + [column[1]]
+    async def run_hook(self, plugin_name, hook, *args):
+        plugin = await self.activate(plugin_name)
+        await getattr(plugin, hook)(*args)
 
-        for plugin in PBPlugin.all:
-            self.load(plugin, column_list)
+    def load_server_settings(self):
+        self.server_settings = {}
+
+        column_list, server_rows = self.bot.plugin_db.run_sync(self.read_server_settings)
+
+        for row in server_rows:
+            settings = dict(zip(column_list, row))
+            server_id = settings.pop("SERVER_ID")
+            self.server_settings[server_id] = settings
+
+        self.clear_index()
+
+    def read_server_settings(self, connection):
+        raw_server_return = SERVER_SETTINGS.run(connection)
+        return [column[0] for column in raw_server_return.description], raw_server_return.fetchall()
+
+    def is_enabled(self, plugin_name, server_id):
+        # Events outside a server (on_ready, direct messages) reach every loaded plugin, whatever its server list
+        if server_id is None:
+            return True
+
+        plugin_info = self.registry.get_plugin(plugin_name)
+
+        if plugin_info is None:
+            globality = 'all'
+        elif plugin_info.globality == 'manual':
+            return server_id in plugin_info.special_servers
+        else:
+            globality = plugin_info.globality
+
+        setting = self.server_settings.get(server_id, {}).get(plugin_name)
+
+        if setting == 'true':
+            return True
+        elif setting == 'false':
+            return plugin_name == 'BaseCommands'
+        else:
+            return not globality in ['optional', 'choice']
+
+    def index_server(self, server_id):
+        plugin_names = tuple(plugin_name for plugin_name in self.registry.plugins if self.is_enabled(plugin_name, server_id))
+
+        # (plugin name, handler) pairs.  Plugins that haven't been imported yet get a stand-in that starts them on first call.
+        subscribers = {}
+        for hook, hook_plugins in self.subscriptions.items():
+            handlers = []
+
+            for plugin_name in plugin_names:
+                if plugin_name in hook_plugins:
+                    plugin_instance = self.registry.get_plugin(plugin_name).instance
+
+                    if plugin_instance is None:
+                        handlers.append((plugin_name, functools.partial(self.run_hook, plugin_name, hook)))
+                    else:
+                        handlers.append((plugin_name, getattr(plugin_instance, hook)))
+
+            subscribers[hook] = tuple(handlers)
+
+        self.server_index[server_id] = plugin_names
+        self.server_subscribers[server_id] = subscribers
+        return plugin_names
+
+    def drop_server(self, server_id):
+        self.server_index.pop(server_id, None)
+        self.server_subscribers.pop(server_id, None)
+
+    def clear_index(self):
+        self.server_index = {}
+        self.server_subscribers = {}
+
+    def has_subscribers(self, hook):
+        return bool(self.subscriptions[hook])
+
+    def needs_permissions(self, subscribers):
+        return any(plugin_name in self.permission_subscribers for plugin_name, handler in subscribers)
+
+    def get_subscribers(self, hook, server=None):
+        server_id = server.id if server else None
+
+        subscribers = self.server_subscribers.get(server_id)
+        if subscribers is None:
+            self.index_server(server_id)
+            subscribers = self.server_subscribers[server_id]
+
+        return subscribers[hook]
+
+    async def set_plugin_enabled(self, server, plugin_name, enabled):
+        if plugin_name == 'BaseCommands' and not enabled:
+            return False
+
+        setting = 'true' if enabled else 'false'
+
+        # The in-memory settings only change once the row is committed, so a failed write (raised to the caller) changes nothing
+        await self.bot.plugin_db.write(self.write_server_setting, server.id, plugin_name, setting)
+
+        self.server_settings.setdefault(server.id, {})[plugin_name] = setting
+        self.index_server(server.id)
+        return True
+
+    def write_server_setting(self, connection, server_id, plugin_name, setting):
+        ADD_SERVER_SETTINGS.run(connection, (server_id,))
+        SET_SERVER_SETTING.bind(column=plugin_name).run(connection, (setting, server_id))
+
+    def get_command(self, command_key):
+        return self.registry.get_command(command_key)
+
+    def get_enabled(self, server=None):
+        server_id = server.id if server else None
+
+        plugin_names = self.server_index.get(server_id)
+        if plugin_names is None:
+            plugin_names = self.index_server(server_id)
+
+        return plugin_names
+
+    def get_enabled_names(self, server=None):
+        return self.get_enabled(server)
 
     async def get_all(self, server=None):
         plugins = []
-        for plugin in self.bot.plugins:
-            if server:
-                plugins.append(plugin)
-            else:
-                plugins.append(plugin)
-        return plugins
+
+        for plugin_name in self.get_enabled(server):
+            plugins.append(await self.activate(plugin_name))
+
+        return tuple(plugins)
 
     async def get_plugin_by_name(self, name):
-        plugins = []
-        for plugin in self.bot.plugins:
-            if type(plugin).__name__ == name:
-                plugins.append(plugin)
+        if self.registry.get_plugin(name) is None:
+            return None
 
-        if len(plugins) == 1:
-            return plugins[0]
-        else:
-            print('[PB] ERROR - Duplicate Plugins, using first.')
-            return plugins[0]
+        return await self.activate(name)
 
 class PBPluginConfig:
     def __init__(self, plasmaBot, config_file, plugin_name, key_dict):
@@ -187,6 +626,9 @@ class PBPluginConfig:
             for variable in item:
                 setattr(self, variable[0], config.get(key, variable[0], fallback=variable[2]))
 
+        # An optional [Storage] section overrides the bot's database settings for this plugin's databases
+        self.storage_options = dict(config.items('Storage', raw=True)) if config.has_section('Storage') else {}
+
 class Response:
     def __init__(self, content=None, reply=False, delete_after=0, send_help=None, help_message=None, permissions_error=None, context_error=None):
         self.content = content
@@ -215,147 +657,59 @@ class PBPluginMeta(type):
 class PBPlugin(object, metaclass=PBPluginMeta):
 
     name = None
-    globality = None #can be [serverID, serverID, serverID] "all" or "choice"
+    globality = None #can be [serverID, serverID, serverID] "all" or "optional" (disabled until enabled on a server)
+    needs_permissions = False #set to True if on_message relies on message_type telling owners apart in ordinary chat
 
     def __init__(self, plasmaBot):
         self.bot = plasmaBot
         self.toggles = None
 
-    async def on_command(self, message, message_type, message_context): #check for blacklisted user tbd #check for server moderation role / perms, tbd #check for private channel, tbd
-        message_content = message.content.strip()
+    async def on_start(self):
+        # Awaited once after construction, before the plugin's first command or event.  Database setup goes here rather than in __init__, which runs on the event loop.
+        pass
+
+    def unload(self):
+        # Called when the plugin is replaced by a hot reload.  Override to release connections and background tasks.
+        pass
 
-        command, *args = message_content.split()
-        command = command[len(self.bot.config.prefix):].lower().strip()
+    async def on_command(self, pb_command, context): #check for blacklisted user tbd #check for server moderation role / perms, tbd #check for private channel, tbd
+        command = pb_command.key
+        handler = pb_command.handler
+        message = context.message
+        args = list(context.args)
 
-        handler = getattr(self, 'cmd_%s' % command, None)
         if not handler:
             return
         else:
             if False:
                 pass
             else:
-                argspec = inspect.signature(handler)
-                params = argspec.parameters.copy()
+                plan = pb_command.plan
 
                 try:
-                    handler_kwargs = {}
-
-                    if params.pop('message', None):
-                        handler_kwargs['message'] = message
-
-                    if params.pop('channel', None):
-                        handler_kwargs['channel'] = message.channel
-
-                    if params.pop('author', None):
-                        handler_kwargs['author'] = message.author
-
-                    if params.pop('auth_perms', None):
-                        if message_context == 'server':
-                            auth_perms = await self.bot.permissions.check_permissions(message.author, message.channel, message.server)
-                        else:
-                            auth_perms = await self.bot.permissions.check_permissions(message.author, message.channel, None)
-                        handler_kwargs['auth_perms'] = auth_perms
-
-                    if params.pop('server', None):
-                        if message_context == 'direct':
-                            await self.bot.safe_send_message(
-                                message.channel, '{}, This command ({}{}) is not supported in direct messages'.format(message.author.mention, self.bot.config.prefix, command)
-                            )
-                            return
-                        handler_kwargs['server'] = message.server
-
-                    if params.pop('bot_member', None):
-                        if message_context == 'direct':
-                            await self.bot.safe_send_message(
-                                message.channel, '{}, This command ({}{}) is not supported in direct messages'.format(message.author.mention, self.bot.config.prefix, command)
-                            )
-                            return
-                        handler_kwargs['bot_member'] = message.server.me
-
-                    if params.pop('user_mentions', None):
-                        if message_context == 'direct':
-                            await self.bot.safe_send_message(
-                                message.channel, '{}, This command ({}{}) is not supported in direct messages'.format(message.author.mention, self.bot.config.prefix, command)
-                            )
-                            return
-                        handler_kwargs['user_mentions'] = list(map(message.server.get_member, message.raw_mentions))
-
-                    if params.pop('channel_mentions', None):
-                        if message_context == 'direct':
-                            await self.bot.safe_send_message(
-                                message.channel, '{}, This command ({}{}) is not supported in direct messages'.format(message.author.mention, self.bot.config.prefix, command)
-                            )
-                            return
-                        handler_kwargs['channel_mentions'] = list(map(message.server.get_channel, message.raw_channel_mentions))
-
-                    if params.pop('role_mentions', None):
-                        if message_context == 'direct':
-                            await self.bot.safe_send_message(
-                                message.channel, '{}, This command ({}{}) is not supported in direct messages'.format(message.author.mention, self.bot.config.prefix, command)
-                            )
-                            return
-                        handler_kwargs['role_mentions'] = message.role_mentions
-
-                    if params.pop('raw_role_mentions', None):
-                        if message_context == 'direct':
-                            await self.bot.safe_send_message(
-                                message.channel, '{}, This command ({}{}) is not supported in direct messages'.format(message.author.mention, self.bot.config.prefix, command)
-                            )
-                            return
-                        handler_kwargs['raw_role_mentions'] = message.raw_role_mentions
-
-                    if params.pop('voice_channel', None):
-                        if message_context == 'direct':
-                            await self.bot.safe_send_message(
-                                message.channel, '{}, This command ({}{}) is not supported in direct messages'.format(message.author.mention, self.bot.config.prefix, command)
-                            )
-                            return
-                        handler_kwargs['voice_channel'] = message.server.me.voice_channel
-
-                    if params.pop('message_type', None):
-                        handler_kwargs['message_type'] = message_type
-
-                    if params.pop('message_context', None):
-                        handler_kwargs['message_context'] = message_context
-
-                    if params.pop('leftover_args', None):
-                        handler_kwargs['leftover_args'] = args
-
-                    args_expected = []
-                    for key, param in list(params.items()):
-                        doc_key = '[%s=%s]' % (key, param.default) if param.default is not inspect.Parameter.empty else key
-                        args_expected.append(doc_key)
+                    if plan.server_only and context.location == 'direct':
+                        await self.bot.safe_send_message(
+                            message.channel, '{}, This command ({}{}) is not supported in direct messages'.format(message.author.mention, self.bot.config.prefix, command)
+                        )
+                        return
 
-                        if not args and param.default is not inspect.Parameter.empty:
-                            params.pop(key)
-                            continue
+                    handler_kwargs = {}
 
-                        if args:
-                            arg_value = args.pop(0)
-                            handler_kwargs[key] = arg_value
-                            params.pop(key)
+                    for key, inject in plan.injectors:
+                        handler_kwargs[key] = inject(context, args)
 
-                    if params:
-                        raw_commands_return = self.bot.plugin_db.table('commands').select("PLUGIN_NAME", "COMMAND_USAGE", "COMMAND_DESCRIPTION").where("COMMAND_KEY").equals(command).execute()
+                    if plan.auth_perms:
+                        handler_kwargs['auth_perms'] = await context.auth_perms()
 
-                        cmd_plugin = ''
-                        cmd_usage = ''
-                        cmd_description = ''
+                    missing_args = len(args) < plan.required_args
 
-                        for command_data in raw_commands_return:
-                            cmd_plugin = command_data[0]
-                            cmd_usage = command_data[1]
-                            cmd_description = command_data[2]
+                    for key, arg_value in zip(plan.positional_args, args):
+                        handler_kwargs[key] = arg_value
 
-                        raw_plugin_return = self.bot.plugin_db.table('plugins').select("FANCY_NAME").where("PLUGIN_NAME").equals(cmd_plugin).execute()
-                        for item in raw_plugin_return:
-                            cmd_plugin = item[0]
+                    del args[:len(plan.positional_args)]
 
-                        help_response = '```Usage for ' + self.bot.config.prefix + command
-                        help_response += ' (' + cmd_plugin + '):'
-                        help_response += '\n     '
-                        help_response += cmd_usage + '\n\n'
-                        help_response += cmd_description + '```'
+                    if missing_args:
+                        help_response = self.bot.plugin_manager.help.usage(command)
 
                         await self.bot.safe_send_message(
                             message.channel,
@@ -368,31 +722,7 @@ class PBPlugin(object, metaclass=PBPluginMeta):
 
                     if response and isinstance(response, Response):
                         if response.send_help:
-                            raw_commands_return = self.bot.plugin_db.table('commands').select("PLUGIN_NAME", "COMMAND_USAGE", "COMMAND_DESCRIPTION").where("COMMAND_KEY").equals(command).execute()
-
-                            cmd_plugin = ''
-                            cmd_usage = ''
-                            cmd_description = ''
-
-                            for command_data in raw_commands_return:
-                                cmd_plugin = command_data[0]
-                                cmd_usage = command_data[1]
-                                cmd_description = command_data[2]
-
-                            raw_plugin_return = self.bot.plugin_db.table('plugins').select("FANCY_NAME").where("PLUGIN_NAME").equals(cmd_plugin).execute()
-                            for item in raw_plugin_return:
-                                cmd_plugin = item[0]
-
-                            help_response = '```Usage for ' + self.bot.config.prefix + command
-                            help_response += ' (' + cmd_plugin + '):'
-                            help_response += '\n     '
-                            help_response += cmd_usage + '\n\n'
-                            help_response += cmd_description
-
-                            if response.help_message:
-                                help_response += '\n\n' + response.help_message
-
-                            help_response +=  '```'
+                            help_response = self.bot.plugin_manager.help.usage(command, response.help_message)
 
                             await self.bot.safe_send_message(
                                 message.channel,
@@ -490,7 +820,7 @@ class PBPlugin(object, metaclass=PBPluginMeta):
     async def on_ready(self):
         pass
 
-    async def on_message(self, message, message_type, message_context):
+    async def on_message(self, message, context):
         pass
 
     async def on_message_edit(self, before, after):
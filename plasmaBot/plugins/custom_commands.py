@@ -1,20 +1,32 @@
 from plasmaBot.plugin import PBPlugin, PBPluginMeta, PBPluginConfig, Response
 import discord
+import sqlite3
+import traceback
 
 from plasmaBot import exceptions
-
-from SQLiteHelper import SQLiteHelper as sq
+from plasmaBot.queries import PBQuery, DROP_TABLE
 
 import logging
 log = logging.getLogger('discord')
 
 
-class dbt_custom_commands_server_instance(object):
+# Database Default Classes
+class dbt_custom_commands(object):
     def __init__(self):
-        self.columns = ["COMMAND_KEY", "RESPONSE"]
-        self.datatypes = ["TEXT PRIMARY KEY NOT NULL", "TEXT"]
+        self.columns = ["SERVER_ID", "COMMAND_KEY", "RESPONSE"]
+        self.datatypes = ["TEXT NOT NULL", "TEXT NOT NULL", "TEXT"]
+        self.constraints = ["PRIMARY KEY (SERVER_ID, COMMAND_KEY)"]
         self.seed = []
 
+# Queries
+CUSTOM_COMMANDS = PBQuery('custom_commands', "SELECT SERVER_ID, COMMAND_KEY, RESPONSE FROM custom_commands")
+SET_CUSTOM_COMMAND = PBQuery('set_custom_command', "INSERT OR REPLACE INTO custom_commands (SERVER_ID, COMMAND_KEY, RESPONSE) VALUES (?, ?, ?)")
+DELETE_CUSTOM_COMMAND = PBQuery('delete_custom_command', "DELETE FROM custom_commands WHERE SERVER_ID = ? AND COMMAND_KEY = ?")
+
+# Older versions kept a server_<id> table per server
+LEGACY_TABLES = PBQuery('legacy_custom_command_tables', "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'server\\_%' ESCAPE '\\'")
+COPY_LEGACY_COMMANDS = PBQuery('copy_legacy_custom_commands', "INSERT OR IGNORE INTO custom_commands (SERVER_ID, COMMAND_KEY, RESPONSE) SELECT ?, COMMAND_KEY, RESPONSE FROM {table}")
+
 
 class CustomCommands(PBPlugin):
     name = 'Custom Server Commands'
@@ -26,9 +38,46 @@ class CustomCommands(PBPlugin):
 
         self.pl_config = PBPluginConfig(plasmaBot, 'custom_commands.ini', 'CUSTOM COMMANDS', {'Files':[['commands_db_location', 'The location of the Custom Commands database', 'data/custom_commands']]})
 
-        self.commands_db = sq.Connect(self.pl_config.commands_db_location)
-        self.commands_db_connection = self.commands_db.getConn()
-        self.commands_db_cursor = self.commands_db_connection.cursor()
+        self.commands_db = self.bot.storage.get(self.pl_config.commands_db_location, self.pl_config.storage_options)
+
+        # Every server's commands are kept in memory ({server_id: {command_key: response}}), so answering one never touches the database.  Changes are written through.
+        self.commands = {}
+
+    async def on_start(self):
+        await self.commands_db.create_table('custom_commands', dbt_custom_commands())
+
+        migrated = await self.commands_db.write(self.migrate)
+        if migrated:
+            print('[PB][CUSTOM COMMANDS] Moved the Custom Commands of {} servers into the custom_commands table'.format(migrated))
+
+        for server_id, command_key, response in await self.commands_db.fetch_all(CUSTOM_COMMANDS):
+            self.commands.setdefault(server_id, {})[command_key] = response
+
+    def migrate(self, connection):
+        # Runs on the writer thread, so each old table is copied and dropped in the same transaction
+        migrated = 0
+
+        for (table_name,) in LEGACY_TABLES.run(connection).fetchall():
+            server_id = table_name[len('server_'):]
+
+            if not server_id.isdigit():
+                continue
+
+            COPY_LEGACY_COMMANDS.bind(table=table_name).run(connection, (server_id,))
+            DROP_TABLE.bind(table=table_name).run(connection)
+            migrated += 1
+
+        return migrated
+
+    async def write(self, query, params):
+        # The in-memory commands only change once their row is committed, so a failed write leaves both as they were
+        try:
+            await self.commands_db.execute(query, params)
+        except sqlite3.Error:
+            traceback.print_exc()
+            return False
+
+        return True
 
     async def cmd_custom(self, message, auth_perms, leftover_args):
         """
@@ -48,16 +97,16 @@ class CustomCommands(PBPlugin):
         else:
             modifier = None
 
+        server_commands = self.commands.get(server.id)
+
         if not modifier:
-            if not self.commands_db.table('server_{}'.format(server.id)).tableExists():
+            if not server_commands:
                 return Response('{} does not have Custom Commands enabled'.format(server.name), reply=False, delete_after=30)
             else:
                 commands_response = '**{}\'s Custom Commands:**\n```'.format(server.name)
 
-                commands_return = self.commands_db.table('server_{}'.format(server.id)).select("COMMAND_KEY").execute()
-
-                for custom_command in commands_return:
-                    commands_response += ' • ' + self.bot.config.prefix + custom_command[0] + '\n'
+                for custom_command in sorted(server_commands):
+                    commands_response += ' • ' + self.bot.config.prefix + custom_command + '\n'
 
                 commands_response += '```'
 
@@ -67,33 +116,18 @@ class CustomCommands(PBPlugin):
             if auth_perms >= 35:
                 possible_command_name = leftover_args[0].strip()
 
-                raw_commands_return = self.bot.plugin_db.table('commands').select("PLUGIN_NAME").where("COMMAND_KEY").equals(possible_command_name.lower()).execute()
-
-                does_exist = False
-
-                for command in raw_commands_return:
-                    does_exist = True
-
-                if does_exist:
+                if self.bot.plugin_manager.registry.is_command(possible_command_name.lower()):
                     return Response('Bot Command `{prefix}{custom_command}` can not be overwriten by a Custom Command!'.format(prefix=self.bot.config.prefix, custom_command=possible_command_name.lower()), reply=True, delete_after=15)
 
                 possible_command_response = message.content[len(self.bot.config.prefix + 'custom {} {} '.format(modifier, leftover_args[0])):].strip()
 
-                if not self.commands_db.table('server_{}'.format(server.id)).tableExists():
-                    initiation_glob = dbt_custom_commands_server_instance()
-                    self.commands_db.table('server_{}'.format(server.id)).init(initiation_glob)
-
-                raw_custom_commands_return = self.commands_db.table('server_{}'.format(server.id)).select("RESPONSE").where("COMMAND_KEY").equals(possible_command_name.lower()).execute()
-
-                custom_does_exist = False
-
-                for custom_command in raw_custom_commands_return:
-                    custom_does_exist = True
-
-                if custom_does_exist:
+                if server_commands and possible_command_name.lower() in server_commands:
                     return Response('Custom Command `{prefix}{custom_command}` already exists!  Use `{prefix}custom edit {custom_command} (New_Response)` to modify it.'.format(prefix=self.bot.config.prefix, custom_command=possible_command_name), reply=True, delete_after=30)
 
-                self.commands_db.table('server_{}'.format(server.id)).insert(possible_command_name.lower(), possible_command_response).into("COMMAND_KEY", "RESPONSE")
+                if not await self.write(SET_CUSTOM_COMMAND, (server.id, possible_command_name.lower(), possible_command_response)):
+                    return Response('Custom Command `{prefix}{custom_command}` could not be saved.  Please try again later.'.format(prefix=self.bot.config.prefix, custom_command=possible_command_name.lower()), reply=True, delete_after=30)
+
+                self.commands.setdefault(server.id, {})[possible_command_name.lower()] = possible_command_response
 
                 return Response('Custom Command `{prefix}{custom_command}` Successfully Created!'.format(prefix=self.bot.config.prefix, custom_command=possible_command_name.lower()), reply=True, delete_after=30)
 
@@ -105,22 +139,18 @@ class CustomCommands(PBPlugin):
                 possible_command_name = leftover_args[0].strip()
                 possible_command_response = message.content[len(self.bot.config.prefix + 'custom {} {} '.format(modifier, leftover_args[0])):].strip()
 
-                if not self.commands_db.table('server_{}'.format(server.id)).tableExists():
+                if not server_commands:
                     return Response('{} does not have Custom Commands enabled.  Use `{}custom add {} (content)` to create this command'.format(server.name, self.bot.config.prefix, possible_command_name.lower()), reply=True, delete_after=30)
 
-                raw_custom_commands_return = self.commands_db.table('server_{}'.format(server.id)).select("RESPONSE").where("COMMAND_KEY").equals(possible_command_name.lower()).execute()
-
-                custom_does_exist = False
-
-                for custom_command in raw_custom_commands_return:
-                    custom_does_exist = True
-
-                if custom_does_exist:
+                if possible_command_name.lower() in server_commands:
 
                     if possible_command_response == '':
                         return Response('Custom Command `{prefix}{command}` can not have an empty response.  Use `{prefix}custom edit {command} (content)` to edit this command'.format(prefix=self.bot.config.prefix, command=possible_command_name.lower()), reply=True, delete_after=30)
 
-                    self.commands_db.table('server_{}'.format(server.id)).update("RESPONSE").setTo(possible_command_response).where("COMMAND_KEY").equals(possible_command_name.lower()).execute()
+                    if not await self.write(SET_CUSTOM_COMMAND, (server.id, possible_command_name.lower(), possible_command_response)):
+                        return Response('Custom Command `{prefix}{command}` could not be updated.  Please try again later.'.format(prefix=self.bot.config.prefix, command=possible_command_name.lower()), reply=True, delete_after=30)
+
+                    self.commands.setdefault(server.id, {})[possible_command_name.lower()] = possible_command_response
                     return Response('Response for `{prefix}{command}` updated!'.format(prefix=self.bot.config.prefix, command=possible_command_name.lower()), reply=True, delete_after=30)
                 else:
                     return Response('Custom Command `{prefix}{command}` does not exist.  Use `{prefix}custom add {command} (content)` to create this command'.format(prefix=self.bot.config.prefix, command=possible_command_name.lower()), reply=True, delete_after=30)
@@ -129,35 +159,27 @@ class CustomCommands(PBPlugin):
 
         elif modifier == 'remove' or modifier == 'delete':
             if auth_perms >= 35:
-                possible_command_name = leftover_args[0].strip()
+                possible_command_name = leftover_args[0].strip().lower()
 
-                if not self.commands_db.table('server_{}'.format(server.id)).tableExists():
+                if not server_commands:
                     return Response('{} does not have Custom Commands enabled.'.format(server.name), reply=True, delete_after=30)
 
-                raw_custom_commands_return = self.commands_db.table('server_{}'.format(server.id)).select("RESPONSE").where("COMMAND_KEY").equals(possible_command_name).execute()
-
-                custom_does_exist = False
-
-                for custom_command in raw_custom_commands_return:
-                    custom_does_exist = True
-
-                if not custom_does_exist:
+                if not possible_command_name in server_commands:
                     return Response('Custom Command `{prefix}{command}` does not exist.'.format(prefix=self.bot.config.prefix, command=possible_command_name), reply=True, delete_after=30)
 
-                all_custom_commands_return = self.commands_db.table('server_{}'.format(server.id)).select("COMMAND_KEY").execute()
+                if not await self.write(DELETE_CUSTOM_COMMAND, (server.id, possible_command_name)):
+                    return Response('Custom Command `{prefix}{command}` could not be removed.  Please try again later.'.format(prefix=self.bot.config.prefix, command=possible_command_name), reply=True, delete_after=30)
 
-                custom_commands_list = []
+                # Looked up again, as the server's commands may have changed while the write was queued
+                server_commands = self.commands.get(server.id, {})
+                server_commands.pop(possible_command_name, None)
 
-                for custom_command_all in all_custom_commands_return:
-                    custom_commands_list += [custom_command[0]]
+                if not server_commands:
+                    self.commands.pop(server.id, None)
 
-                if len(custom_commands_list) == 1:
-                    self.commands_db_cursor.execute('DROP TABLE IF EXISTS server_{}'.format(server.id))
-                    self.commands_db_connection.commit()
+                if not server.id in self.commands:
                     return Response('Custom Command `{prefix}{command}` has been removed and Custom Commands have been disabled.'.format(prefix=self.bot.config.prefix, command=possible_command_name), reply=True, delete_after=30)
 
-                else:
-                    self.commands_db.table('server_{}'.format(server.id)).delete().where("COMMAND_KEY").equals(possible_command_name).execute()
                 return Response('Custom Command `{prefix}{command}` has been removed.'.format(prefix=self.bot.config.prefix, command=possible_command_name), reply=True, delete_after=30)
             else:
                 return Response(permissions_error=True)
@@ -165,23 +187,18 @@ class CustomCommands(PBPlugin):
         else:
             return Response(send_help=True, help_message='Unrecognized Modifier \'{}\''.format(modifier))
 
-    async def on_message(self, message, message_type, message_context):
+    async def on_message(self, message, context):
         if not message.author.bot:
-            if message.server and message.content.strip().startswith(self.bot.config.prefix):
-                command, *args = message.content.strip().split()
-                command = command[len(self.bot.config.prefix):].lower().strip()
-
-                if self.commands_db.table('server_{}'.format(message.server.id)).tableExists():
-                    custom_commands_return = self.commands_db.table('server_{}'.format(message.server.id)).select("RESPONSE").where("COMMAND_KEY").equals(command).execute()
+            if message.server and context.is_command:
+                command = context.command_key
+                args = context.args
 
-                    custom_does_exist = False
-                    custom_message = ''
+                server_commands = self.commands.get(message.server.id)
 
-                    for custom_command in custom_commands_return:
-                        custom_does_exist = True
-                        custom_message = custom_command[0]
+                if server_commands:
+                    custom_message = server_commands.get(command)
 
-                    if custom_does_exist:
+                    if custom_message is not None:
                         try:
                             response = custom_message.format(args=args)
                         except IndexError:
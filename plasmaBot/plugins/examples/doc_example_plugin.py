@@ -26,7 +26,7 @@ class EXAMPLECOMMAND(PBPlugin):
         #do stuff here
         return Response('message string or variable to send to the channel where the message was sent', reply=True, delete_after=15) #reply = True if you want the message to reply to the original message author, delete_after is the time until bot's message will be auto-deleted, 0 means never delete (although don't do this unless necesary as it is a config feature to delete messages or not) OPTIONAL ARGUMENTS: (1) return Response(send_help=True) will send the command's help message, and can be used in combination with help_message='Error Message to Be included' to include an Error Message in with the Help Response. (2) return Response(permissions_error=True) returns the default Permissions Error message to the channel.
 
-    async def on_message(self, message, message_type, message_context): # plugins have access to all bot events.  Only exception to normall formating is the requirement of message_type, message_contextm and auth_perms in on_message which supply the sender of the message [owner, self, bot (other bot), or user] as a string or the place where it was sent ([server, direct] as a string for server channels vs direct messages as well as the permissions level for the message author)
+    async def on_message(self, message, context): # plugins have access to all bot events.  Only exception to normall formating is the context argument in on_message, the message already parsed for every plugin (see ['context'] below)
         pass #replace this with your code if you want to use the bot-event
 
 ##################################################
@@ -50,5 +50,7 @@ class EXAMPLECOMMAND(PBPlugin):
 
 # ['message_context'] = message_context ('server' if message was sent in a server channel, or 'direct' if sent in over a DM)
 
+# ['context'] = context (the PBMessageContext shared by every plugin handling this message: context.message_type, context.location ('server' or 'direct'), context.is_command, context.command_key, context.args, context.lowered (the stripped message content in lowercase), context.user_mentions and await context.auth_perms().  It is read-only.)
+
 # ['leftover_args'] = args (the message without the command, split by spaces in a list)
 ###################################################
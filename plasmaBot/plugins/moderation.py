@@ -2,9 +2,9 @@ from plasmaBot.plugin import PBPlugin, PBPluginMeta, Response, PBPluginConfig
 import discord
 import asyncio
 
-from SQLiteHelper import SQLiteHelper as sq
-
 from plasmaBot import exceptions
+from plasmaBot.context import command_key
+from plasmaBot.queries import PBQuery
 
 import logging
 log = logging.getLogger('discord')
@@ -23,6 +23,17 @@ class dbt_moderation_roles(object):
         self.datatypes = ["TEXT PRIMARY KEY NOT NULL", "TEXT", "TEXT"]
         self.seed = []
 
+# Queries
+MODERATION_PREFERENCES = PBQuery('moderation_preferences', "SELECT SERVER_ID, PRESERVE_OVERRIDES, SOFT_MUTE FROM s_preferences WHERE SERVER_ID = ?")
+ADD_MODERATION_PREFERENCES = PBQuery('add_moderation_preferences', "INSERT OR IGNORE INTO s_preferences (SERVER_ID, PRESERVE_OVERRIDES, SOFT_MUTE) VALUES (?, ?, ?)")
+SET_PRESERVE_OVERRIDES = PBQuery('set_preserve_overrides', "UPDATE s_preferences SET PRESERVE_OVERRIDES = ? WHERE SERVER_ID = ?")
+SET_SOFT_MUTE = PBQuery('set_soft_mute', "UPDATE s_preferences SET SOFT_MUTE = ? WHERE SERVER_ID = ?")
+
+MODERATION_ROLES = PBQuery('moderation_roles', "SELECT ROLE_MUTE, ROLE_DEAFEN FROM s_roles WHERE SERVER_ID = ?")
+ADD_MODERATION_ROLES = PBQuery('add_moderation_roles', "INSERT OR IGNORE INTO s_roles (SERVER_ID, ROLE_MUTE, ROLE_DEAFEN) VALUES (?, ?, ?)")
+SET_MUTE_ROLE = PBQuery('set_mute_role', "UPDATE s_roles SET ROLE_MUTE = ? WHERE SERVER_ID = ?")
+SET_DEAFEN_ROLE = PBQuery('set_deafen_role', "UPDATE s_roles SET ROLE_DEAFEN = ? WHERE SERVER_ID = ?")
+
 
 class Moderation(PBPlugin):
     name = 'Moderation'
@@ -36,22 +47,18 @@ class Moderation(PBPlugin):
 
         self.pl_config = PBPluginConfig(plasmaBot, 'moderation.ini', 'MODERATION', {'Files':[['moderation_db_location', 'The location of the moderation database', 'data/moderation']]})
 
-        self.moderation_db = sq.Connect(self.pl_config.moderation_db_location)
+        self.moderation_db = self.bot.storage.get(self.pl_config.moderation_db_location, self.pl_config.storage_options)
 
-        if not self.moderation_db.table('s_preferences').tableExists():
-            initiation_glob = dbt_moderation_settings()
-            self.moderation_db.table('s_preferences').init(initiation_glob)
-
-        if not self.moderation_db.table('s_roles').tableExists():
-            initiation_glob = dbt_moderation_roles()
-            self.moderation_db.table('s_roles').init(initiation_glob)
+    async def on_start(self):
+        await self.moderation_db.create_table('s_preferences', dbt_moderation_settings())
+        await self.moderation_db.create_table('s_roles', dbt_moderation_roles())
 
 
     async def toggle(self, server, key):
 
         #Get Server Data
 
-        moderation_settings = self.moderation_db.table('s_preferences').select("SERVER_ID", "PRESERVE_OVERRIDES", "SOFT_MUTE").where("SERVER_ID").equals(server.id).execute()
+        moderation_settings = await self.moderation_db.fetch_all(MODERATION_PREFERENCES, (server.id,))
 
         SERVER_ID = None
         PRESERVE_OVERRIDES = None
@@ -69,12 +76,12 @@ class Moderation(PBPlugin):
 
         if isinstance( server_id, int ):
             if not (PRESERVE_OVERRIDES == 'true' or PRESERVE_OVERRIDES == 'false'):
-                self.moderation_db.table('s_preferences').update("PRESERVE_OVERRIDES").setTo('true').where("SERVER_ID").equals(server.id).execute()
+                await self.moderation_db.execute(SET_PRESERVE_OVERRIDES, ('true', server.id))
 
             if not (SOFT_MUTE == 'true' or SOFT_MUTE == 'false'):
-                self.moderation_db.table('s_preferences').update("SOFT_MUTE").setTo('false').where("SERVER_ID").equals(server.id).execute()
+                await self.moderation_db.execute(SET_SOFT_MUTE, ('false', server.id))
         else:
-            self.moderation_db.table('s_preferences').insert(server.id, "true", "false").into("SERVER_ID", "PRESERVE_OVERRIDES", "SOFT_MUTE")
+            await self.moderation_db.execute(ADD_MODERATION_PREFERENCES, (server.id, "true", "false"))
 
         #Handle Keys
 
@@ -92,7 +99,7 @@ class Moderation(PBPlugin):
             if PRESERVE_OVERRIDES == None:
                 PRESERVE_OVERRIDES = 'true'
             else:
-                self.moderation_db.table('s_preferences').update("PRESERVE_OVERRIDES").setTo(PRESERVE_OVERRIDES).where("SERVER_ID").equals(server.id).execute()
+                await self.moderation_db.execute(SET_PRESERVE_OVERRIDES, (PRESERVE_OVERRIDES, server.id))
 
             return ['SUCCESS', PRESERVE_OVERRIDES]
 
@@ -110,7 +117,7 @@ class Moderation(PBPlugin):
             if SOFT_MUTE == None:
                 SOFT_MUTE = 'false'
             else:
-                self.moderation_db.table('s_preferences').update("SOFT_MUTE").setTo(SOFT_MUTE).where("SERVER_ID").equals(server.id).execute()
+                await self.moderation_db.execute(SET_SOFT_MUTE, (SOFT_MUTE, server.id))
 
             return ['SUCCESS', SOFT_MUTE]
 
@@ -122,7 +129,7 @@ class Moderation(PBPlugin):
 
         #Get Server Data
 
-        moderation_settings = self.moderation_db.table('s_preferences').select("SERVER_ID", "PRESERVE_OVERRIDES", "SOFT_MUTE").where("SERVER_ID").equals(server.id).execute()
+        moderation_settings = await self.moderation_db.fetch_all(MODERATION_PREFERENCES, (server.id,))
 
         SERVER_ID = None
         PRESERVE_OVERRIDES = None
@@ -140,12 +147,12 @@ class Moderation(PBPlugin):
 
         if isinstance( server_id, int ):
             if not (PRESERVE_OVERRIDES == 'true' or PRESERVE_OVERRIDES == 'false'):
-                self.moderation_db.table('s_preferences').update("PRESERVE_OVERRIDES").setTo('true').where("SERVER_ID").equals(server.id).execute()
+                await self.moderation_db.execute(SET_PRESERVE_OVERRIDES, ('true', server.id))
 
             if not (SOFT_MUTE == 'true' or SOFT_MUTE == 'false'):
-                self.moderation_db.table('s_preferences').update("SOFT_MUTE").setTo('false').where("SERVER_ID").equals(server.id).execute()
+                await self.moderation_db.execute(SET_SOFT_MUTE, ('false', server.id))
         else:
-            self.moderation_db.table('s_preferences').insert(server.id, "true", "false").into("SERVER_ID", "PRESERVE_OVERRIDES", "SOFT_MUTE")
+            await self.moderation_db.execute(ADD_MODERATION_PREFERENCES, (server.id, "true", "false"))
 
         #Pull Key
 
@@ -198,7 +205,7 @@ class Moderation(PBPlugin):
             mute_role = None
             defen_role = None
 
-            server_role_entry = self.moderation_db.table('s_roles').select("ROLE_MUTE", "ROLE_DEAFEN").where("SERVER_ID").equals(server.id).execute()
+            server_role_entry = await self.moderation_db.fetch_all(MODERATION_ROLES, (server.id,))
 
             everyone_permissions = None
             role_mute = 'DNE'
@@ -237,7 +244,7 @@ class Moderation(PBPlugin):
                 await self.bot.move_role(server, role_return[0], role_position)
 
                 if not assign_db:
-                    self.moderation_db.table('s_roles').update("ROLE_MUTE").setTo(role_return[0].id).where("SERVER_ID").equals(server.id).execute()
+                    await self.moderation_db.execute(SET_MUTE_ROLE, (role_return[0].id, server.id))
 
                 for channel in server.channels:
                     await self.bot.edit_channel_permissions(channel, role_return[0], overwrite=m_overwrite)
@@ -251,13 +258,13 @@ class Moderation(PBPlugin):
                 await self.bot.move_role(server, role_return[1], role_position)
 
                 if not assign_db:
-                    self.moderation_db.table('s_roles').update("ROLE_DEAFEN").setTo(role_return[1].id).where("SERVER_ID").equals(server.id).execute()
+                    await self.moderation_db.execute(SET_DEAFEN_ROLE, (role_return[1].id, server.id))
 
                 for channel in server.channels:
                     await self.bot.edit_channel_permissions(channel, role_return[1], overwrite=d_overwrite)
 
             if assign_db:
-                self.moderation_db.table('s_roles').insert(server.id, role_return[0].id, role_return[1].id).into("SERVER_ID", "ROLE_MUTE", "ROLE_DEAFEN")
+                await self.moderation_db.execute(ADD_MODERATION_ROLES, (server.id, role_return[0].id, role_return[1].id))
 
             return role_return
 
@@ -809,22 +816,10 @@ class Moderation(PBPlugin):
             manage_messages = channel.permissions_for(bot_member).manage_messages
 
             def is_bot_command(possible_command_fire):
-                if possible_command_fire.content.strip().startswith(self.bot.config.prefix):
-
-                    possible_command_handler, *args = possible_command_fire.content.strip().split()
-                    possible_command_handler = possible_command_handler[len(self.bot.config.prefix):].lower().strip()
-
-                    possible_command_info = self.bot.plugin_db.table('commands').select("PLUGIN_NAME").where("COMMAND_KEY").equals(possible_command_handler).execute()
+                possible_command_handler = command_key(possible_command_fire.content, self.bot.config.prefix)
 
-                    possible_plugin_name = None
-
-                    for possible_command in possible_command_info:
-                        possible_plugin_name = possible_command[0]
-
-                    if possible_plugin_name:
-                        return True
-                    else:
-                        return False
+                if possible_command_handler is not None:
+                    return self.bot.plugin_manager.registry.is_command(possible_command_handler)
                 elif possible_command_fire.author == bot_member:
                     return True
                 else:
@@ -897,7 +892,7 @@ class Moderation(PBPlugin):
 
 
     async def on_server_join(self, server):
-        moderation_settings = self.moderation_db.table('s_preferences').select("SERVER_ID", "PRESERVE_OVERRIDES", "SOFT_MUTE").where("SERVER_ID").equals(server.id).execute()
+        moderation_settings = await self.moderation_db.fetch_all(MODERATION_PREFERENCES, (server.id,))
 
         SERVER_ID = None
         PRESERVE_OVERRIDES = None
@@ -915,9 +910,9 @@ class Moderation(PBPlugin):
 
         if isinstance( server_id, int ):
             if not (PRESERVE_OVERRIDES == 'true' or PRESERVE_OVERRIDES == 'false'):
-                self.moderation_db.table('s_preferences').update("PRESERVE_OVERRIDES").setTo('true').where("SERVER_ID").equals(server.id).execute()
+                await self.moderation_db.execute(SET_PRESERVE_OVERRIDES, ('true', server.id))
 
             if not (SOFT_MUTE == 'true' or SOFT_MUTE == 'false'):
-                self.moderation_db.table('s_preferences').update("SOFT_MUTE").setTo('true').where("SERVER_ID").equals(server.id).execute()
+                await self.moderation_db.execute(SET_SOFT_MUTE, ('true', server.id))
         else:
-            self.moderation_db.table('s_preferences').insert(server.id, "true", "true").into("SERVER_ID", "PRESERVE_OVERRIDES", "SOFT_MUTE")
+            await self.moderation_db.execute(ADD_MODERATION_PREFERENCES, (server.id, "true", "true"))
@@ -4,8 +4,7 @@ import random
 import discord
 
 from plasmaBot import exceptions
-
-from SQLiteHelper import SQLiteHelper as sq
+from plasmaBot.queries import PBQuery
 
 import logging
 log = logging.getLogger('discord')
@@ -17,6 +16,12 @@ class dbt_afk(object):
         self.datatypes = ["TEXT PRIMARY KEY NOT NULL", "TEXT", "TEXT"]
         self.seed = []
 
+# Queries
+AFK_STATE = PBQuery('afk_state', "SELECT AFK_STATE FROM afk WHERE USER_ID = ?")
+AFK_MESSAGE = PBQuery('afk_message', "SELECT AFK_MESSAGE FROM afk WHERE USER_ID = ?")
+SET_AFK = PBQuery('set_afk', "INSERT OR REPLACE INTO afk (USER_ID, AFK_STATE, AFK_MESSAGE) VALUES (?, 'True', ?)")
+CLEAR_AFK = PBQuery('clear_afk', "UPDATE afk SET AFK_STATE = 'False' WHERE USER_ID = ?")
+
 
 class Utilities(PBPlugin):
     name = 'Utilities'
@@ -72,16 +77,15 @@ class Utilities(PBPlugin):
 
         #Utilities Database for AFK
 
-        self.utilities_db = sq.Connect(self.pl_config.utilities_db_location)
-
-        if not self.utilities_db.table('afk').tableExists():
-            initiation_glob = dbt_afk()
-            self.utilities_db.table('afk').init(initiation_glob)
+        self.utilities_db = self.bot.storage.get(self.pl_config.utilities_db_location, self.pl_config.storage_options)
 
         #8ball Information
 
         self.ball_responses = ['It is certain', 'It is decidedly so', 'Without a doubt', 'Yes, definitely', 'You may rely on it', 'As I see it, yes', 'Most likely', 'Outlook good', 'Yes', 'Signs point to yes', 'Reply hazy try again', 'Ask again later', 'Better not tell you now', 'Cannot predict now', 'Concentrate and ask again', 'Don\'t count on it', 'My reply is no', 'My sources say no', 'Outlook not so good', 'Very doubtful']
 
+    async def on_start(self):
+        await self.utilities_db.create_table('afk', dbt_afk())
+
     def round_sig(self, x):
         return round(x, 6-int(floor(log10(x)))-1)
 
@@ -179,18 +183,7 @@ class Utilities(PBPlugin):
         afk_message = message.content[len(self.bot.config.prefix + 'afk '):].strip()
         afk_message = afk_message.replace('\n', ' ')
 
-        user_return = self.utilities_db.table('afk').select("AFK_STATE").where("USER_ID").equals(author.id).execute()
-
-        afk_state = None
-
-        for user in user_return:
-            afk_state = user[0]
-
-        if afk_state:
-            self.utilities_db.table('afk').update("AFK_STATE").setTo('True').where("USER_ID").equals(author.id).execute()
-            self.utilities_db.table('afk').update("AFK_MESSAGE").setTo(afk_message).where("USER_ID").equals(author.id).execute()
-        else:
-            self.utilities_db.table('afk').insert(author.id, 'True', afk_message).into("USER_ID", "AFK_STATE", "AFK_MESSAGE")
+        await self.utilities_db.execute(SET_AFK, (author.id, afk_message))
 
         return Response('🔹 🔶 🔹 {} is AFK: {} 🔹 🔶 🔹'.format(self.bot.get_display_name(author), afk_message), reply=False, delete_after=45)
 
@@ -240,42 +233,35 @@ class Utilities(PBPlugin):
         return Response(response, reply=True, delete_after=60)
 
 
-    async def on_message(self, message, message_type, message_context):
+    async def on_message(self, message, context):
         if message.server:
-            user_mentions = list(map(message.server.get_member, message.raw_mentions))
-            author_afk_content = self.utilities_db.table('afk').select("AFK_STATE").where("USER_ID").equals(message.author.id).execute()
+            user_mentions = context.user_mentions
+            keeps_afk = context.command_is('afk', 'sudo', 'say')
+            author_afk_content = await self.utilities_db.fetch_one(AFK_STATE, (message.author.id,))
 
-            author_afk = None
-
-            for author in author_afk_content:
-                author_afk = author[0]
+            author_afk = author_afk_content[0] if author_afk_content else None
 
             if author_afk == 'True':
-                if not message.content.lower().startswith(self.bot.config.prefix + 'afk') and not message.content.lower().startswith(self.bot.config.prefix + 'sudo') and not message.content.lower().startswith(self.bot.config.prefix + 'say'):
-                    self.utilities_db.table('afk').update("AFK_STATE").setTo('False').where("USER_ID").equals(message.author.id).execute()
+                if not keeps_afk:
+                    await self.utilities_db.execute(CLEAR_AFK, (message.author.id,))
                     await self.bot.safe_send_message(message.channel, '🔹 🔶 🔹 {} is no longer AFK 🔹 🔶 🔹'.format(self.bot.get_display_name(message.author)), expire_in=60)
 
-            if not message.author.bot and not message.content.lower().startswith(self.bot.config.prefix + 'sudo') and not message.content.lower().startswith(self.bot.config.prefix + 'say') and not message.content.lower().startswith(self.bot.config.prefix + 'afk'):
+            if not message.author.bot and not keeps_afk:
                 afk_users = []
 
                 for user in user_mentions:
                     if not user.id == message.author.id:
-                        user_afk_content = self.utilities_db.table('afk').select("AFK_STATE").where("USER_ID").equals(user.id).execute()
-
-                        user_afk = None
+                        user_afk_content = await self.utilities_db.fetch_one(AFK_STATE, (user.id,))
 
-                        for user_info in user_afk_content:
-                            user_afk = user_info[0]
+                        user_afk = user_afk_content[0] if user_afk_content else None
 
                         if user_afk == 'True':
                             afk_users += [user]
 
                 if len(afk_users) >= 1:
                     if len(afk_users) == 1:
-                        afk_message_info = self.utilities_db.table('afk').select("AFK_MESSAGE").where("USER_ID").equals(afk_users[0].id).execute()
-                        afk_message = ''
-                        for user_return in afk_message_info:
-                            afk_message = user_return[0]
+                        afk_message_info = await self.utilities_db.fetch_one(AFK_MESSAGE, (afk_users[0].id,))
+                        afk_message = afk_message_info[0] if afk_message_info else ''
                         response = '🔹 🔶 🔹 {} is AFK: {} 🔹 🔶 🔹'.format(self.bot.get_display_name(afk_users[0]), afk_message)
                     else:
                         users_response = '{}'.format(afk_users[0].nick)
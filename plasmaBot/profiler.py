@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+
+PB_PROFILE_DIRECTORY = 'data'
+
+# Seconds between stack samples.  At 5ms the sampler thread costs well under 1% of a core.
+PB_PROFILE_INTERVAL = 0.005
+
+PB_PROFILE_MAX_SECONDS = 300
+
+class PBSamplingProfiler:
+    def __init__(self, plasmaBot):
+        self.bot = plasmaBot
+
+        self.running = False
+        self.stacks = {}
+        self.samples = 0
+
+    def frame_name(self, frame):
+        code = frame.f_code
+        return '{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+    def sample(self, thread_id, stop, interval):
+        # Runs on its own thread, reading the event loop thread's current stack
+        while not stop.wait(interval):
+            frame = sys._current_frames().get(thread_id)
+
+            stack = []
+            while frame is not None:
+                stack.append(self.frame_name(frame))
+                frame = frame.f_back
+
+            stack = ';'.join(reversed(stack))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    async def profile(self, seconds, interval=PB_PROFILE_INTERVAL):
+        self.running = True
+        self.stacks = {}
+        self.samples = 0
+
+        stop = threading.Event()
+        sampler = threading.Thread(target=self.sample, args=(threading.get_ident(), stop, interval), daemon=True)
+
+        try:
+            sampler.start()
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await self.bot.loop.run_in_executor(None, sampler.join)
+            self.running = False
+
+        report_file = os.path.join(PB_PROFILE_DIRECTORY, 'profile_{}.folded'.format(time.strftime('%Y%m%d_%H%M%S')))
+        await self.bot.loop.run_in_executor(None, self.write_report, report_file)
+
+        return report_file
+
+    def write_report(self, report_file):
+        # Collapsed stack format, readable by flamegraph.pl and speedscope
+        with open(report_file, 'w') as profile_file:
+            for stack, count in sorted(self.stacks.items(), key=lambda item: item[1], reverse=True):
+                profile_file.write('{} {}\n'.format(stack, count))
+
+    def top_frames(self, limit=10):
+        self_counts = {}
+        total_counts = {}
+
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            self_counts[frames[-1]] = self_counts.get(frames[-1], 0) + count
+
+            for frame in set(frames):
+                total_counts[frame] = total_counts.get(frame, 0) + count
+
+        top = sorted(self_counts.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [(frame, count, total_counts[frame]) for frame, count in top]
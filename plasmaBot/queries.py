@@ -0,0 +1,68 @@
+import re
+
+# Every statement the bot runs is a PBQuery built once at import.  sqlite3 keeps a prepared statement per SQL string on each connection
+# (see PB_STATEMENT_CACHE in plasmaBot.storage), so reusing the same string skips parsing the SQL again.  Values always go in as ? parameters.
+
+PB_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def identifier(name):
+    # Table and column names can't be parameters.  Anything formatted into SQL must pass this first.
+    name = str(name)
+
+    if not PB_IDENTIFIER.match(name):
+        raise ValueError('Unsafe SQL identifier {!r}'.format(name))
+
+    return '"{}"'.format(name)
+
+class PBQuery:
+    __slots__ = ('name', 'sql', 'bound')
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        self.bound = {}
+
+    def bind(self, **identifiers):
+        # For statements with {placeholders} for table or column names.  Each set of names is checked and formatted once, then reused.
+        key = tuple(sorted(identifiers.items()))
+        query = self.bound.get(key)
+
+        if query is None:
+            query = self.bound[key] = PBQuery(self.name, self.sql.format(**dict((placeholder, identifier(name)) for placeholder, name in identifiers.items())))
+
+        return query
+
+    def run(self, connection, params=()):
+        return connection.execute(self.sql, params)
+
+    def run_many(self, connection, rows):
+        return connection.executemany(self.sql, rows)
+
+    def __repr__(self):
+        return '<PBQuery {}>'.format(self.name)
+
+# Schema
+TABLE_EXISTS = PBQuery('table_exists', "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?")
+TABLE_INFO = PBQuery('table_info', "PRAGMA table_info({table})")
+DROP_TABLE = PBQuery('drop_table', "DROP TABLE IF EXISTS {table}")
+ADD_COLUMN = PBQuery('add_column', "ALTER TABLE {table} ADD COLUMN {column} TEXT")
+
+# Plugin database
+SERVER_SETTINGS = PBQuery('server_settings', "SELECT * FROM servers")
+ADD_SERVER_SETTINGS = PBQuery('add_server_settings', "INSERT OR IGNORE INTO servers (SERVER_ID) VALUES (?)")
+SET_SERVER_SETTING = PBQuery('set_server_setting', "UPDATE servers SET {column} = ? WHERE SERVER_ID = ?")
+
+EXPIRING_MESSAGES = PBQuery('expiring_messages', "SELECT CHANNEL_ID, MESSAGE_ID, DELETE_AT FROM expiring_messages")
+SAVE_EXPIRING_MESSAGE = PBQuery('save_expiring_message', "INSERT OR REPLACE INTO expiring_messages (CHANNEL_ID, MESSAGE_ID, DELETE_AT) VALUES (?, ?, ?)")
+DELETE_EXPIRING_MESSAGE = PBQuery('delete_expiring_message', "DELETE FROM expiring_messages WHERE MESSAGE_ID = ?")
+
+MIRROR_HASHES = PBQuery('mirror_hashes', "SELECT TABLE_NAME, CONTENT_HASH FROM mirror_state")
+SET_MIRROR_HASH = PBQuery('set_mirror_hash', "INSERT OR REPLACE INTO mirror_state (TABLE_NAME, CONTENT_HASH) VALUES (?, ?)")
+
+# Permissions database
+GLOBAL_PERMISSIONS = PBQuery('global_permissions', "SELECT PERMISSIONS_LEVEL FROM global WHERE USER_ID = ?")
+SERVER_PERMISSIONS = PBQuery('server_permissions', "SELECT OWNER_ID, ADMINISTRATOR_ROLE_ID, MODERATOR_ROLE_ID, HELPER_ROLE_ID, BLACKLISTED_ROLE_ID FROM servers WHERE SERVER_ID = ?")
+SERVER_OWNER = PBQuery('server_owner', "SELECT OWNER_ID FROM servers WHERE SERVER_ID = ?")
+SET_SERVER_OWNER = PBQuery('set_server_owner', "UPDATE servers SET OWNER_ID = ? WHERE SERVER_ID = ?")
+ADD_SERVER_PERMISSIONS = PBQuery('add_server_permissions', "INSERT INTO servers (SERVER_ID, OWNER_ID, ADMINISTRATOR_ROLE_ID, MODERATOR_ROLE_ID, HELPER_ROLE_ID, BLACKLISTED_ROLE_ID) VALUES (?, ?, ?, ?, ?, ?)")
+SET_SERVER_PERMISSIONS = PBQuery('set_server_permissions', "UPDATE servers SET OWNER_ID = ?, ADMINISTRATOR_ROLE_ID = ?, MODERATOR_ROLE_ID = ?, HELPER_ROLE_ID = ?, BLACKLISTED_ROLE_ID = ? WHERE SERVER_ID = ?")
@@ -0,0 +1,86 @@
+import threading
+
+from plasmaBot.queries import PBQuery
+
+class PBQueryEntry:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+class PBQueryStats:
+    def __init__(self, plasmaBot):
+        self.bot = plasmaBot
+
+        # (caller, query name) -> PBQueryEntry.  Written from the storage threads, so behind a lock.
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def caller(self):
+        # Called on the event loop as a database call is made.  The command, hook or gateway event being stepped is charged for it.
+        active = self.bot.latency.active
+
+        if active is None:
+            return 'background'
+
+        active.queries += 1
+        return '{}:{}'.format(active.kind, active.key)
+
+    def describe(self, function, args):
+        if args and isinstance(args[0], PBQuery):
+            return args[0].name, args[0].sql
+
+        return function.__name__, getattr(function, '__qualname__', function.__name__)
+
+    def record(self, caller, function, args, seconds):
+        # Called from a storage thread once the call has run
+        name, statement = self.describe(function, args)
+
+        with self.lock:
+            entry = self.entries.get((caller, name))
+            if entry is None:
+                entry = self.entries[(caller, name)] = PBQueryEntry()
+
+            entry.count += 1
+            entry.total += seconds
+            entry.max = max(entry.max, seconds)
+
+        threshold = self.bot.config.slow_query_threshold
+
+        if threshold and seconds * 1000 >= threshold:
+            print('[PB][STORAGE] Slow query {} took {:.1f} ms ({}): {}'.format(name, seconds * 1000, caller, statement))
+
+    def reset(self):
+        with self.lock:
+            self.entries = {}
+
+    def summary(self, kind=None):
+        # One row per caller, slowest total first.  kind limits it to 'command', 'hook', 'event' or 'background' callers.
+        with self.lock:
+            entries = list(self.entries.items())
+
+        callers = {}
+
+        for (caller, name), entry in entries:
+            if kind and caller.split(':', 1)[0] != kind:
+                continue
+
+            row = callers.get(caller)
+            if row is None:
+                row = callers[caller] = {'caller': caller, 'count': 0, 'total': 0.0, 'max': 0.0, 'queries': []}
+
+            row['count'] += entry.count
+            row['total'] += entry.total
+            row['max'] = max(row['max'], entry.max)
+            row['queries'].append({'name': name, 'count': entry.count, 'total': entry.total, 'max': entry.max})
+
+        rows = list(callers.values())
+
+        for row in rows:
+            row['queries'].sort(key=lambda query: query['total'], reverse=True)
+
+        rows.sort(key=lambda row: row['total'], reverse=True)
+        return rows
+
+    def stats(self):
+        return self.summary()
@@ -0,0 +1,66 @@
+class PBPluginInfo:
+    def __init__(self, plugin_name, fancy_name, globality, special_servers, help_exclude, module=None):
+        self.plugin_name = plugin_name
+        self.fancy_name = fancy_name
+        self.globality = globality
+        self.special_servers = special_servers
+        self.help_exclude = help_exclude
+        self.module = module
+
+        self.command_keys = ()
+
+        # Set once the plugin's module has been imported and the plugin started
+        self.instance = None
+
+class PBRegistry:
+    def __init__(self):
+        # Authoritative copy of plugin, command and toggle metadata.  The plugin database only mirrors it for external tools.
+        self.plugins = {}
+        self.commands = {}
+        self.toggles = {}
+
+        self.command_keys = frozenset()
+
+    def add_plugin(self, plugin_info):
+        self.plugins[plugin_info.plugin_name] = plugin_info
+
+    def add_command(self, command):
+        if command.key in self.commands:
+            return False
+
+        self.commands[command.key] = command
+        return True
+
+    def add_toggle(self, toggle_name, plugin_name):
+        if toggle_name in self.toggles:
+            return False
+
+        self.toggles[toggle_name] = plugin_name
+        return True
+
+    def remove_plugin(self, plugin_name):
+        plugin_info = self.plugins.pop(plugin_name)
+
+        for command_key in plugin_info.command_keys:
+            self.commands.pop(command_key, None)
+
+        for toggle_name, toggle_plugin in list(self.toggles.items()):
+            if toggle_plugin == plugin_name:
+                del self.toggles[toggle_name]
+
+        return plugin_info
+
+    def freeze(self):
+        self.command_keys = frozenset(self.commands)
+
+    def get_plugin(self, plugin_name):
+        return self.plugins.get(plugin_name)
+
+    def get_command(self, command_key):
+        return self.commands.get(command_key)
+
+    def get_toggle(self, toggle_name):
+        return self.toggles.get(toggle_name)
+
+    def is_command(self, command_key):
+        return command_key in self.command_keys
@@ -0,0 +1,391 @@
+import os
+import queue
+import asyncio
+import sqlite3
+import threading
+import time
+import traceback
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from plasmaBot import exceptions
+from plasmaBot.queries import PBQuery, TABLE_EXISTS, identifier
+
+# Most writes the writer thread groups into one transaction
+PB_WRITE_BATCH = 100
+
+# Prepared statements each connection keeps.  Comfortably more than the distinct queries in plasmaBot.queries and the plugins.
+PB_STATEMENT_CACHE = 256
+
+PB_JOURNAL_MODES = ('delete', 'truncate', 'persist', 'memory', 'wal', 'off')
+PB_SYNCHRONOUS_MODES = ('off', 'normal', 'full', 'extra')
+
+def execute(connection, query, params):
+    return query.run(connection, params).rowcount
+
+def execute_many(connection, query, rows):
+    return query.run_many(connection, rows).rowcount
+
+def fetch_all(connection, query, params):
+    return query.run(connection, params).fetchall()
+
+def fetch_one(connection, query, params):
+    return query.run(connection, params).fetchone()
+
+def table_exists(connection, table_name):
+    return TABLE_EXISTS.run(connection, (table_name,)).fetchone() is not None
+
+def table_queries(table_name, table_raw):
+    # The CREATE and INSERT statements for one of the dbt_ classes in plasmaBot.defaults.database_tables (or a plugin's own).  Every name is checked by identifier().
+    columns = ', '.join(identifier(column) for column in table_raw.columns)
+
+    # Table constraints (a primary key over several columns, say) are optional, given as SQL after the columns
+    definitions = ['{} {}'.format(identifier(column), datatype) for column, datatype in zip(table_raw.columns, table_raw.datatypes)] + list(getattr(table_raw, 'constraints', []))
+
+    create = PBQuery('create_table', "CREATE TABLE {} ({})".format(identifier(table_name), ', '.join(definitions)))
+    insert = PBQuery('seed_table', "INSERT INTO {} ({}) VALUES ({})".format(identifier(table_name), columns, ', '.join('?' * len(table_raw.columns))))
+
+    return create, insert
+
+def create_table(connection, table_name, table_raw, seed=True):
+    # Creates a table from its dbt_ class, with its seed rows unless seed is False
+    if table_exists(connection, table_name):
+        return False
+
+    create, insert = table_queries(table_name, table_raw)
+    create.run(connection)
+
+    if seed and table_raw.seed:
+        insert.run_many(connection, table_raw.seed)
+
+    return True
+
+def maintain(connection, journal_mode):
+    # Lets SQLite refresh the statistics its query planner uses, then folds the WAL back into the database file
+    connection.execute('PRAGMA optimize')
+
+    if journal_mode == 'wal':
+        connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+class PBDatabaseOptions:
+    # [Storage] keys a plugin's config file may override, and the attribute each one sets
+    keys = {'journalmode': 'journal_mode', 'synchronous': 'synchronous', 'cachesize': 'cache_size', 'mmapsize': 'mmap_size', 'busytimeout': 'busy_timeout', 'readthreads': 'read_threads'}
+
+    def __init__(self, config, overrides=None):
+        self.journal_mode = config.db_journal_mode
+        self.synchronous = config.db_synchronous
+        self.cache_size = config.db_cache_size
+        self.mmap_size = config.db_mmap_size
+        self.busy_timeout = config.db_busy_timeout
+        self.read_threads = config.db_read_threads
+
+        for key, value in (overrides or {}).items():
+            attribute = self.keys.get(key.lower())
+
+            if attribute is None:
+                continue
+
+            try:
+                setattr(self, attribute, type(getattr(self, attribute))(value.strip().lower()))
+            except ValueError:
+                raise exceptions.HelpfulError(
+                    "[Storage] {} must be a whole number, not '{}'.".format(key, value),
+                    "Correct the value in your plugin's config file.",
+                    preface="[PB][STORAGE]: \n")
+
+        if not self.journal_mode in PB_JOURNAL_MODES:
+            raise exceptions.HelpfulError(
+                "Unknown SQLite journal mode '{}'.".format(self.journal_mode),
+                "Set [Storage] JournalMode to one of: {}".format(', '.join(PB_JOURNAL_MODES)),
+                preface="[PB][STORAGE]: \n")
+
+        if not self.synchronous in PB_SYNCHRONOUS_MODES:
+            raise exceptions.HelpfulError(
+                "Unknown SQLite synchronous setting '{}'.".format(self.synchronous),
+                "Set [Storage] Synchronous to one of: {}".format(', '.join(PB_SYNCHRONOUS_MODES)),
+                preface="[PB][STORAGE]: \n")
+
+        self.read_threads = max(self.read_threads, 1)
+
+class PBDatabase:
+    def __init__(self, storage, db_path, options):
+        self.storage = storage
+        self.db_path = db_path
+        self.file_name = db_path + '.db'
+        self.options = options
+
+        self.connections = []
+        self.connection_lock = threading.Lock()
+
+        # The journal mode is stored in the database file, so it only needs setting once, before any reader connects
+        self.writer_connection = self.connect()
+        self.journal_mode = self.writer_connection.execute('PRAGMA journal_mode = {}'.format(options.journal_mode)).fetchone()[0]
+
+        if self.journal_mode != options.journal_mode and storage.bot.config.debug:
+            print('[PB][STORAGE] {} is using journal mode {} instead of {}'.format(self.file_name, self.journal_mode, options.journal_mode))
+
+        self.writes = queue.Queue()
+        self.writer = threading.Thread(target=self.write_loop, name='PBStorageWriter({})'.format(db_path), daemon=True)
+        self.writer.start()
+
+        self.readers = ThreadPoolExecutor(options.read_threads)
+        self.local = threading.local()
+
+        self.closed = False
+
+    def connect(self):
+        # Autocommit mode, so the writer thread decides where each transaction begins and ends
+        connection = sqlite3.connect(self.file_name, timeout=self.options.busy_timeout, isolation_level=None, check_same_thread=False, cached_statements=PB_STATEMENT_CACHE)
+
+        # Per connection settings.  A negative cache_size is in KiB rather than pages.
+        connection.execute('PRAGMA synchronous = {}'.format(self.options.synchronous))
+        connection.execute('PRAGMA cache_size = {}'.format(-self.options.cache_size))
+        connection.execute('PRAGMA mmap_size = {}'.format(self.options.mmap_size * 1024 * 1024))
+
+        with self.connection_lock:
+            self.connections.append(connection)
+
+        return connection
+
+    def write_loop(self):
+        connection = self.writer_connection
+
+        while True:
+            batch = [self.writes.get()]
+
+            while len(batch) < PB_WRITE_BATCH:
+                try:
+                    batch.append(self.writes.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            batch = [write for write in batch if write is not None]
+
+            # This is the database's only writer thread.  Whatever goes wrong, it fails the batch and carries on rather than leave every later write waiting forever.
+            try:
+                self.write_group(connection, batch)
+            except Exception as error:
+                traceback.print_exc()
+
+                for write in batch:
+                    self.resolve(write[2], None, error)
+
+            if stop:
+                return
+
+    def write_group(self, connection, batch):
+        # Writes that can't run inside a transaction (checkpoints, VACUUM) split the batch and run on their own
+        group = []
+
+        for write in batch:
+            if write[3]:
+                group.append(write)
+                continue
+
+            if group:
+                self.write_batch(connection, group)
+                group = []
+
+            self.write_alone(connection, write)
+
+        if group:
+            self.write_batch(connection, group)
+
+    def write_alone(self, connection, write):
+        function, args, future, transactional, caller = write
+
+        try:
+            result = self.run(connection, function, args, caller)
+        except Exception as error:
+            self.resolve(future, None, error)
+        else:
+            self.resolve(future, result, None)
+
+    def resolve(self, future, result, error):
+        # A future may already be done: cancelled by its awaiting coroutine, or failed by write_loop after a crash
+        if future.done():
+            return
+
+        try:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        except Exception:
+            pass
+
+    def rollback(self, connection):
+        # SQLite may already have rolled the transaction back itself (a full disk or I/O error), in which case ROLLBACK fails too
+        try:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+        except sqlite3.Error:
+            traceback.print_exc()
+
+    def write_batch(self, connection, batch):
+        results = []
+
+        # A transaction left open by a failed rollback would make every later BEGIN fail
+        self.rollback(connection)
+
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+
+            for function, args, future, transactional, caller in batch:
+                # A savepoint per write, so one failing write doesn't undo the rest of the batch
+                connection.execute('SAVEPOINT pb_write')
+
+                try:
+                    result = self.run(connection, function, args, caller)
+                except Exception as error:
+                    connection.execute('ROLLBACK TO pb_write')
+                    results.append((future, None, error))
+                else:
+                    results.append((future, result, None))
+
+                connection.execute('RELEASE pb_write')
+
+            connection.execute('COMMIT')
+        except Exception as error:
+            traceback.print_exc()
+            self.rollback(connection)
+
+            results = [(write[2], None, error) for write in batch]
+
+        # Results are only handed back once they are committed
+        for future, result, error in results:
+            self.resolve(future, result, error)
+
+    def transaction(self, function, *args, transactional=True):
+        # Queues function(connection, *args) for the writer thread.  Returns a concurrent.futures.Future.
+        if self.closed:
+            raise RuntimeError('Database {} is closed'.format(self.db_path))
+
+        future = Future()
+        self.writes.put((function, args, future, transactional, self.storage.bot.query_stats.caller()))
+        return future
+
+    def run_sync(self, function, *args):
+        # Blocks until the writer thread has run and committed function.  For start up, schema changes and shutdown only.
+        return self.transaction(function, *args).result()
+
+    async def write(self, function, *args):
+        return await asyncio.wrap_future(self.transaction(function, *args), loop=self.storage.bot.loop)
+
+    async def read(self, function, *args):
+        return await self.storage.bot.loop.run_in_executor(self.readers, self.read_connection, function, args, self.storage.bot.query_stats.caller())
+
+    def read_connection(self, function, args, caller):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = self.connect()
+
+        return self.run(connection, function, args, caller)
+
+    def run(self, connection, function, args, caller):
+        # Every database call goes through here on a storage thread, timed for PBQueryStats
+        start = time.perf_counter()
+
+        try:
+            return function(connection, *args)
+        finally:
+            self.storage.bot.query_stats.record(caller, function, args, time.perf_counter() - start)
+
+    # Queries are PBQuery objects from plasmaBot.queries or a plugin, never SQL built per call
+
+    async def execute(self, query, params=()):
+        return await self.write(execute, query, params)
+
+    async def execute_many(self, query, rows):
+        return await self.write(execute_many, query, list(rows))
+
+    async def fetch_all(self, query, params=()):
+        return await self.read(fetch_all, query, params)
+
+    async def fetch_one(self, query, params=()):
+        return await self.read(fetch_one, query, params)
+
+    async def has_table(self, table_name):
+        return await self.read(table_exists, table_name)
+
+    async def create_table(self, table_name, table_raw):
+        return await self.write(create_table, table_name, table_raw)
+
+    def execute_sync(self, query, params=()):
+        return self.run_sync(execute, query, params)
+
+    def fetch_all_sync(self, query, params=()):
+        return self.run_sync(fetch_all, query, params)
+
+    def ensure_table(self, table_name, table_raw):
+        return self.run_sync(create_table, table_name, table_raw)
+
+    async def maintain(self):
+        return await asyncio.wrap_future(self.transaction(maintain, self.journal_mode, transactional=False), loop=self.storage.bot.loop)
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            self.transaction(maintain, self.journal_mode, transactional=False).result()
+        except Exception:
+            traceback.print_exc()
+
+        self.closed = True
+
+        self.writes.put(None)
+        self.writer.join()
+        self.readers.shutdown()
+
+        with self.connection_lock:
+            for connection in self.connections:
+                connection.close()
+
+            self.connections = []
+
+class PBStorage:
+    def __init__(self, plasmaBot):
+        self.bot = plasmaBot
+        self.databases = {}
+        self.task = None
+
+    def get(self, db_path, overrides=None):
+        # One PBDatabase (and one writer thread) per database file, however many parts of the bot use it.  Overrides are a plugin's [Storage] config section; the first caller's settings win.
+        key = os.path.abspath(db_path)
+        database = self.databases.get(key)
+
+        if database is None:
+            database = self.databases[key] = PBDatabase(self, db_path, PBDatabaseOptions(self.bot.config, overrides))
+
+        return database
+
+    def start(self):
+        if self.task or not self.bot.config.db_maintenance_interval:
+            return
+
+        self.task = self.bot.loop.create_task(self.run())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.bot.config.db_maintenance_interval * 60)
+
+            for database in list(self.databases.values()):
+                try:
+                    await database.maintain()
+                except Exception:
+                    traceback.print_exc()
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+        for database in self.databases.values():
+            try:
+                database.close()
+            except Exception:
+                traceback.print_exc()
+
+        self.databases = {}
@@ -0,0 +1,98 @@
+import traceback
+import functools
+
+from collections import deque
+
+# Events that are safe to drop when the bot is saturated
+PB_LOW_PRIORITY_EVENTS = frozenset(['on_typing', 'on_member_update', 'on_voice_state_update'])
+
+class PBTaskSupervisor:
+    def __init__(self, plasmaBot, max_tasks, max_plugin_tasks, max_queued):
+        self.bot = plasmaBot
+
+        self.max_tasks = max_tasks
+        self.max_plugin_tasks = max_plugin_tasks
+        self.max_queued = max_queued
+
+        self.running = 0
+        self.plugin_running = {}
+
+        self.queue = deque()
+
+        self.dropped = 0
+        self.delayed = 0
+        self.failures = 0
+        self.plugin_failures = {}
+
+    def can_start(self, owner):
+        return self.running < self.max_tasks and self.plugin_running.get(owner, 0) < self.max_plugin_tasks
+
+    def spawn(self, coro, owner=None, low_priority=False):
+        if self.can_start(owner):
+            self.start(coro, owner)
+            return True
+
+        if low_priority or len(self.queue) >= self.max_queued:
+            # Shed the work instead of letting the backlog grow without bound
+            coro.close()
+            self.dropped += 1
+
+            if self.bot.config.debug:
+                print('[PB][TASKS] Dropped task for {} ({} running, {} queued)'.format(owner, self.running, len(self.queue)))
+            return False
+
+        self.queue.append((coro, owner))
+        self.delayed += 1
+        return True
+
+    def start(self, coro, owner):
+        self.running += 1
+        self.plugin_running[owner] = self.plugin_running.get(owner, 0) + 1
+
+        task = self.bot.loop.create_task(coro)
+        task.add_done_callback(functools.partial(self.task_done, owner))
+        return task
+
+    def task_done(self, owner, task):
+        self.running -= 1
+        self.plugin_running[owner] -= 1
+
+        if not task.cancelled() and task.exception():
+            error = task.exception()
+
+            self.failures += 1
+            self.plugin_failures[owner] = self.plugin_failures.get(owner, 0) + 1
+
+            print('[PB][TASKS] Unhandled Exception in {}:'.format(owner))
+            traceback.print_exception(type(error), error, error.__traceback__)
+
+        self.pump()
+
+    def pump(self):
+        # Each queued entry is looked at once, so a saturated plugin can't hold up work queued behind it for other plugins
+        waiting = len(self.queue)
+
+        while waiting and self.running < self.max_tasks:
+            coro, owner = self.queue.popleft()
+            waiting -= 1
+
+            if self.plugin_running.get(owner, 0) < self.max_plugin_tasks:
+                self.start(coro, owner)
+            else:
+                self.queue.append((coro, owner))
+
+    def cancel_queued(self):
+        while self.queue:
+            coro, owner = self.queue.popleft()
+            coro.close()
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'queued': len(self.queue),
+            'dropped': self.dropped,
+            'delayed': self.delayed,
+            'failures': self.failures,
+            'plugin_running': dict(self.plugin_running),
+            'plugin_failures': dict(self.plugin_failures)
+        }